@@ -7,6 +7,7 @@ import axios from "axios";
 const API_BASE_URL = "https://rocketpooldata.com/api/";
 const BASE_CONTRACT_ENDPOINT = "base_contract_code/";
 const CONTRACT_CODE_ENDPOINT = "contract_code/";
+const DIFF_ENDPOINT = "diff/";
 
 interface Code {
   [key: string]: string;
@@ -18,29 +19,66 @@ interface IContractCode {
   compiler_version: string;
 }
 
+interface IContractDiff {
+  name: string;
+  base_name: string;
+  diff: string;
+  additions: number;
+  deletions: number;
+}
+
 const DiffPage = () => {
   const [searchParams] = useSearchParams();
   const diffName = searchParams.get("diff_name");
   const diffAddress = searchParams.get("addr");
+  // Set by alert links, since an address can be stored on several networks
+  const networkId = searchParams.get("network_id");
+  const networkQuery = networkId ? "?network_id=" + networkId : "";
 
+  const [contractDiff, setContractDiff] = useState<IContractDiff>();
   const [diffNameContract, setDiffNameContract] = useState<IContractCode>();
   const [addrContract, setAddrContract] = useState<IContractCode>();
+  const [showFiles, setShowFiles] = useState(false);
   const [loading, setLoading] = useState(true);
-  const [errors, setErrors] = useState<any[]>([]);
+  const [errors, setErrors] = useState<string[]>([]);
+
+  const addError = (reason: any) =>
+    setErrors((errors) => [...errors, String(reason)]);
+
+  // The main contract diff is computed and cached server side, so only the
+  // compact unified diff is downloaded
+  useEffect(() => {
+    setLoading(true);
+    axios
+      .get<IContractDiff>(
+        API_BASE_URL +
+          DIFF_ENDPOINT +
+          diffAddress +
+          "/" +
+          diffName +
+          networkQuery
+      )
+      .then((res) => setContractDiff(res.data))
+      .catch(addError)
+      .finally(() => setLoading(false));
+  }, [diffName, diffAddress, networkQuery]);
 
+  // Interfaces and libraries need both full sources, fetch them on request
   useEffect(() => {
-    const errors: any[] = [];
+    if (!showFiles) {
+      return;
+    }
     axios
       .get<IContractCode>(API_BASE_URL + BASE_CONTRACT_ENDPOINT + diffName)
       .then((res) => setDiffNameContract(res.data))
-      .catch((reason) => errors.push(reason));
+      .catch(addError);
     axios
-      .get<IContractCode>(API_BASE_URL + CONTRACT_CODE_ENDPOINT + diffAddress)
+      .get<IContractCode>(
+        API_BASE_URL + CONTRACT_CODE_ENDPOINT + diffAddress + networkQuery
+      )
       .then((res) => setAddrContract(res.data))
-      .catch((reason) => errors.push(reason));
-    setErrors(errors);
-    setLoading(false);
-  }, [diffName, diffAddress]);
+      .catch(addError);
+  }, [showFiles, diffName, diffAddress, networkQuery]);
 
   const formatCode = (code?: string) => {
     if (!code) {
@@ -55,6 +93,19 @@ const DiffPage = () => {
     );
   };
 
+  const getDiffLineKind = (line: string): DiffLineKind => {
+    if (line.startsWith("@@")) {
+      return "hunk";
+    }
+    if (line.startsWith("+")) {
+      return "added";
+    }
+    if (line.startsWith("-")) {
+      return "removed";
+    }
+    return "context";
+  };
+
   const getContractCode = (name: string, contract: IContractCode) => {
     return formatCode(contract.code[name]);
   };
@@ -85,31 +136,43 @@ const DiffPage = () => {
     <DiffPageWrapper>
       {loading && "Loading..."}
       {!loading && errors.length > 0 && <>{errors}</>}
-      {!loading && diffNameContract && addrContract && errors.length === 0 && (
+      {!loading && contractDiff && errors.length === 0 && (
         <>
           <Title>Contract Diff</Title>
           <SubTitle>
-            {diffNameContract.name} (Compiler Version{" "}
-            {diffNameContract.compiler_version}) and {addrContract.name}{" "}
-            (Compiler Version {addrContract.compiler_version})
+            {contractDiff.base_name} and {contractDiff.name} (
+            {contractDiff.additions} additions, {contractDiff.deletions}{" "}
+            deletions)
           </SubTitle>
 
           <DiffSection>
             <DiffTitle>Base Contract</DiffTitle>
             <DiffWrapper>
-              <ReactDiffViewer
-                useDarkTheme={false}
-                disableWordDiff
-                oldValue={getContractCode(
-                  diffNameContract.name,
-                  diffNameContract
-                )}
-                newValue={getContractCode(addrContract.name, addrContract)}
-                splitView={true}
-              />
+              <UnifiedDiff>
+                {contractDiff.diff.split("\n").map((line, i) => (
+                  <DiffLine key={i} kind={getDiffLineKind(line)}>
+                    {line}
+                  </DiffLine>
+                ))}
+              </UnifiedDiff>
             </DiffWrapper>
           </DiffSection>
 
+          {!showFiles && (
+            <ShowFilesButton onClick={() => setShowFiles(true)}>
+              Compare interfaces and libraries
+            </ShowFilesButton>
+          )}
+        </>
+      )}
+      {!loading && diffNameContract && addrContract && errors.length === 0 && (
+        <>
+          <SubTitle>
+            {diffNameContract.name} (Compiler Version{" "}
+            {diffNameContract.compiler_version}) and {addrContract.name}{" "}
+            (Compiler Version {addrContract.compiler_version})
+          </SubTitle>
+
           {sharedFiles.length > 0 && (
             <>
               <SubTitle>Shared Interfaces/Libraries</SubTitle>
@@ -176,6 +239,15 @@ const DiffPage = () => {
 export default DiffPage;
 
 /* Styles */
+type DiffLineKind = "added" | "removed" | "hunk" | "context";
+
+const diffLineColors: { [kind in DiffLineKind]: string } = {
+  added: "#e6ffed",
+  removed: "#ffeef0",
+  hunk: "#f1f8ff",
+  context: "#fff",
+};
+
 const DiffPageWrapper = styled.div`
   margin: 20px 32px;
 `;
@@ -186,6 +258,27 @@ const DiffWrapper = styled.div`
   padding: 0 16px;
 `;
 
+const UnifiedDiff = styled.pre`
+  margin: 0;
+  font-size: 12px;
+  line-height: 1.6;
+`;
+
+const DiffLine = styled.div<{ kind: DiffLineKind }>`
+  background: ${(props) => diffLineColors[props.kind]};
+  color: #24292e;
+  padding: 0 8px;
+  white-space: pre-wrap;
+`;
+
+const ShowFilesButton = styled.button`
+  display: block;
+  margin: 0 auto 40px;
+  padding: 8px 16px;
+  font-size: 16px;
+  cursor: pointer;
+`;
+
 const DiffSection = styled.div`
   margin-bottom: 40px;
 `;
@@ -0,0 +1,34 @@
+"""Key contracts by network and address
+
+Revision ID: 3a6f9d2b8e15
+Revises: 7c1d5a9e3b42
+Create Date: 2026-10-20 14:22:09.581630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3a6f9d2b8e15"
+down_revision = "7c1d5a9e3b42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint("contracts_pkey", "contracts", type_="primary")
+    op.create_primary_key("contracts_pkey", "contracts", ["address", "network_id"])
+
+
+def downgrade():
+    # Keep the first contract stored at each address
+    op.execute(
+        """
+        DELETE FROM contracts c
+        USING contracts d
+        WHERE c.address = d.address
+            AND (c.timestamp, c.network_id) > (d.timestamp, d.network_id)
+        """
+    )
+    op.drop_constraint("contracts_pkey", "contracts", type_="primary")
+    op.create_primary_key("contracts_pkey", "contracts", ["address"])
@@ -0,0 +1,40 @@
+"""Add contracts closest base contract
+
+Revision ID: 3f9a6c1e8b70
+Revises: e41c7a9d2f58
+Create Date: 2026-10-18 16:27:14.802316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3f9a6c1e8b70"
+down_revision = "e41c7a9d2f58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "contracts", sa.Column("closest_base_contract", sa.String(), nullable=True)
+    )
+    op.add_column(
+        "contracts", sa.Column("closest_base_diffs", sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        "contracts", sa.Column("base_corpus_version", sa.String(), nullable=True)
+    )
+    op.create_index(
+        "ix_contracts_closest_base_contract",
+        "contracts",
+        ["closest_base_contract", "closest_base_diffs"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_contracts_closest_base_contract", table_name="contracts")
+    op.drop_column("contracts", "base_corpus_version")
+    op.drop_column("contracts", "closest_base_diffs")
+    op.drop_column("contracts", "closest_base_contract")
@@ -0,0 +1,30 @@
+"""Create rate limit buckets
+
+Revision ID: 4e9b2c7a1f63
+Revises: b8f4e1c7d295
+Create Date: 2026-10-20 09:27:31.604182
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "4e9b2c7a1f63"
+down_revision = "b8f4e1c7d295"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "rate_limit_buckets",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("updated_at", postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("rate_limit_buckets")
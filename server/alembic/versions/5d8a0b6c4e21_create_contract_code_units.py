@@ -0,0 +1,30 @@
+"""Create contract code units
+
+Revision ID: 5d8a0b6c4e21
+Revises: 9c3e1f7a2b4d
+Create Date: 2026-10-18 10:41:07.203518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "5d8a0b6c4e21"
+down_revision = "9c3e1f7a2b4d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "contract_code_units",
+        sa.Column("address", sa.String(), nullable=False),
+        sa.Column("code", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.ForeignKeyConstraint(["address"], ["contracts.address"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("address"),
+    )
+
+
+def downgrade():
+    op.drop_table("contract_code_units")
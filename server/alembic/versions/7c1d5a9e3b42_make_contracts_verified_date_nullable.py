@@ -0,0 +1,37 @@
+"""Make contracts verified date nullable
+
+Revision ID: 7c1d5a9e3b42
+Revises: 4e9b2c7a1f63
+Create Date: 2026-10-20 11:05:46.918273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7c1d5a9e3b42"
+down_revision = "4e9b2c7a1f63"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column(
+        "contracts", "verified_date", existing_type=sa.Date(), nullable=True
+    )
+    # Contracts imported by address, the ones stamped at IMPORTED_TIMESTAMP,
+    # were stored with their import date as the verification date
+    op.execute(
+        "UPDATE contracts SET verified_date = NULL "
+        "WHERE timestamp < '1970-01-02T00:00:00+00:00'"
+    )
+
+
+def downgrade():
+    op.execute(
+        "UPDATE contracts SET verified_date = timestamp::date "
+        "WHERE verified_date IS NULL"
+    )
+    op.alter_column(
+        "contracts", "verified_date", existing_type=sa.Date(), nullable=False
+    )
@@ -0,0 +1,43 @@
+"""Create contract diffs
+
+Revision ID: 8d2b5e7f3a16
+Revises: 3f9a6c1e8b70
+Create Date: 2026-10-18 17:45:09.336127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "8d2b5e7f3a16"
+down_revision = "3f9a6c1e8b70"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "contract_diffs",
+        sa.Column("source_hash", sa.String(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("base_name", sa.String(), nullable=False),
+        sa.Column("base_hash", sa.String(), nullable=False),
+        sa.Column("diff", sa.TEXT(), nullable=False),
+        sa.Column("additions", sa.Integer(), nullable=False),
+        sa.Column("deletions", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["source_hash"], ["contract_sources.hash"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("source_hash", "name", "base_name", "base_hash"),
+    )
+
+
+def downgrade():
+    op.drop_table("contract_diffs")
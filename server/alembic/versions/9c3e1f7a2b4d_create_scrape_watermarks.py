@@ -0,0 +1,45 @@
+"""Create scrape watermarks
+
+Revision ID: 9c3e1f7a2b4d
+Revises: 411346f721b4
+Create Date: 2026-10-18 09:12:44.512307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "9c3e1f7a2b4d"
+down_revision = "411346f721b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "scrape_watermarks",
+        sa.Column(
+            "network_id",
+            postgresql.ENUM(
+                "mainnet", "fantom", "arbitrum", name="networkid", create_type=False
+            ),
+            nullable=False,
+        ),
+        sa.Column("last_address", sa.String(), nullable=False),
+        sa.Column("last_verified_date", sa.Date(), nullable=False),
+        sa.Column(
+            "last_full_scrape", postgresql.TIMESTAMP(timezone=True), nullable=True
+        ),
+        sa.Column(
+            "updated_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("network_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("scrape_watermarks")
@@ -0,0 +1,35 @@
+"""Create backfill checkpoints
+
+Revision ID: a6d3f8c2e157
+Revises: c5e8f2a4d917
+Create Date: 2026-10-18 19:41:08.263517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "a6d3f8c2e157"
+down_revision = "c5e8f2a4d917"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "backfill_checkpoints",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column(
+            "updated_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("backfill_checkpoints")
@@ -0,0 +1,28 @@
+"""Add contracts timestamp index
+
+Revision ID: b7e2d4f19c03
+Revises: 5d8a0b6c4e21
+Create Date: 2026-10-18 14:12:36.540291
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b7e2d4f19c03"
+down_revision = "5d8a0b6c4e21"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_contracts_timestamp_address",
+        "contracts",
+        ["timestamp", "address"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_contracts_timestamp_address", table_name="contracts")
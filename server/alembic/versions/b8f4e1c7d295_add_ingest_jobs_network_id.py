@@ -0,0 +1,77 @@
+"""Add ingest jobs network id
+
+Revision ID: b8f4e1c7d295
+Revises: d93b6e2f7c41
+Create Date: 2026-10-19 10:14:52.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "b8f4e1c7d295"
+down_revision = "d93b6e2f7c41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "ingest_jobs",
+        sa.Column(
+            "network_id",
+            postgresql.ENUM(
+                "mainnet", "fantom", "arbitrum", name="networkid", create_type=False
+            ),
+            nullable=True,
+        ),
+    )
+    # Fetch jobs carry the chain id in their payload, process jobs take the
+    # network of the stored contract
+    op.execute(
+        """
+        UPDATE ingest_jobs SET network_id = CASE payload->>'network_id'
+            WHEN '1' THEN 'mainnet'
+            WHEN '250' THEN 'fantom'
+            WHEN '42161' THEN 'arbitrum'
+        END::networkid
+        WHERE payload ? 'network_id'
+        """
+    )
+    op.execute(
+        """
+        UPDATE ingest_jobs SET network_id = contracts.network_id
+        FROM contracts
+        WHERE ingest_jobs.network_id IS NULL
+            AND contracts.address = ingest_jobs.address
+        """
+    )
+    op.execute("UPDATE ingest_jobs SET network_id = 'fantom' WHERE network_id IS NULL")
+    op.alter_column("ingest_jobs", "network_id", nullable=False)
+
+    op.drop_index("ix_ingest_jobs_stage_address", table_name="ingest_jobs")
+    op.create_index(
+        "ix_ingest_jobs_stage_network_id_address",
+        "ingest_jobs",
+        ["stage", "network_id", "address"],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_ingest_jobs_stage_network_id_address", table_name="ingest_jobs")
+    # Keep one job per stage and address, as the old key allows
+    op.execute(
+        """
+        DELETE FROM ingest_jobs a USING ingest_jobs b
+        WHERE a.stage = b.stage AND a.address = b.address AND a.job_id > b.job_id
+        """
+    )
+    op.create_index(
+        "ix_ingest_jobs_stage_address",
+        "ingest_jobs",
+        ["stage", "address"],
+        unique=True,
+    )
+    op.drop_column("ingest_jobs", "network_id")
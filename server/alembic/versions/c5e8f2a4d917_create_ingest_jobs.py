@@ -0,0 +1,69 @@
+"""Create ingest jobs
+
+Revision ID: c5e8f2a4d917
+Revises: 8d2b5e7f3a16
+Create Date: 2026-10-18 19:02:41.659813
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "c5e8f2a4d917"
+down_revision = "8d2b5e7f3a16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ingest_jobs",
+        sa.Column("job_id", postgresql.BIGINT(), nullable=False),
+        sa.Column(
+            "stage", sa.Enum("fetch", "process", name="ingeststage"), nullable=False
+        ),
+        sa.Column("address", sa.String(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("pending", "running", "done", "dead", name="jobstatus"),
+            nullable=False,
+        ),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.TEXT(), nullable=True),
+        sa.Column(
+            "run_after",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("locked_at", postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("job_id"),
+    )
+    op.create_index(
+        "ix_ingest_jobs_stage_address",
+        "ingest_jobs",
+        ["stage", "address"],
+        unique=True,
+    )
+    op.create_index(
+        "ix_ingest_jobs_stage_status_run_after",
+        "ingest_jobs",
+        ["stage", "status", "run_after"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_ingest_jobs_stage_status_run_after", table_name="ingest_jobs")
+    op.drop_index("ix_ingest_jobs_stage_address", table_name="ingest_jobs")
+    op.drop_table("ingest_jobs")
+    sa.Enum(name="jobstatus").drop(op.get_bind(), checkfirst=False)
+    sa.Enum(name="ingeststage").drop(op.get_bind(), checkfirst=False)
@@ -0,0 +1,232 @@
+"""Add contract sources search vector
+
+Revision ID: d93b6e2f7c41
+Revises: f2c7b9e4a318
+Create Date: 2026-10-18 22:18:51.604729
+
+"""
+import json
+import re
+from typing import Iterable, List, NamedTuple
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.types import TypeDecorator
+
+
+class TSVector(TypeDecorator):
+    impl = TSVECTOR
+    cache_ok = True
+
+
+# revision identifiers, used by Alembic.
+revision = "d93b6e2f7c41"
+down_revision = "f2c7b9e4a318"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+# Frozen copy of app.search as of this revision, so the migration builds the
+# same vectors however the app's tokenizer changes later
+MAX_SEARCH_DOCUMENT_CHARS = 192 * 1024
+
+_comment_or_string_regex = re.compile(
+    r"//[^\n]*|/\*.*?\*/|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'", re.DOTALL
+)
+_identifier_regex = re.compile(r"0[xX][0-9a-fA-F]+|[A-Za-z_$][A-Za-z0-9_$]*|[0-9]+")
+
+
+class SearchDocument(NamedTuple):
+    name: str
+    abi_identifiers: str
+    source_identifiers: str
+
+
+contract_sources = sa.table(
+    "contract_sources",
+    sa.column("hash", sa.String),
+    sa.column("abi", sa.String),
+    sa.column("source_code", sa.String),
+    sa.column("search_vector", TSVector()),
+)
+
+
+def upgrade():
+    op.add_column(
+        "contract_sources", sa.Column("search_vector", TSVector(), nullable=True)
+    )
+    # Built before the old vector is dropped, so search never comes up empty.
+    # Later changes to app.search are applied with `python -m app.cli
+    # reindex-search --all`.
+    _build_search_vectors()
+    op.create_index(
+        "ix_contract_sources_search_vector",
+        "contract_sources",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.drop_index(
+        "ix_contract_sources___ts_vector__",
+        table_name="contract_sources",
+        postgresql_using="gin",
+    )
+    op.drop_column("contract_sources", "__ts_vector__")
+
+
+def _build_search_vectors():
+    conn = op.get_bind()
+    stmt = (
+        contract_sources.update()
+        .where(contract_sources.c.hash == sa.bindparam("source_hash"))
+        .values(
+            search_vector=search_vector(
+                sa.bindparam("source_name"),
+                sa.bindparam("source_abi_identifiers"),
+                sa.bindparam("source_identifiers"),
+            )
+        )
+    )
+    after_hash = ""
+    while True:
+        rows = conn.execute(
+            sa.select(
+                contract_sources.c.hash,
+                contract_sources.c.abi,
+                contract_sources.c.source_code,
+            )
+            .where(contract_sources.c.hash > after_hash)
+            .order_by(contract_sources.c.hash)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if len(rows) == 0:
+            return
+        params = []
+        for row in rows:
+            document = make_search_document(row.abi, row.source_code)
+            params.append(
+                dict(
+                    source_hash=row.hash,
+                    source_name=document.name,
+                    source_abi_identifiers=document.abi_identifiers,
+                    source_identifiers=document.source_identifiers,
+                )
+            )
+        conn.execute(stmt, params)
+        after_hash = rows[-1].hash
+
+
+def make_search_document(abi: str, source_code: str) -> SearchDocument:
+    try:
+        data = json.loads(source_code)[0]
+        name = data.get("ContractName") or ""
+        source = _flatten_sources(data.get("SourceCode") or "")
+    except (ValueError, LookupError, TypeError, AttributeError):
+        name, source = "", source_code
+
+    source = _comment_or_string_regex.sub(_strip_comment, source)
+    name = _truncate(name, MAX_SEARCH_DOCUMENT_CHARS)
+    abi_identifiers = _truncate(
+        _join(_abi_identifiers(abi)), MAX_SEARCH_DOCUMENT_CHARS - len(name)
+    )
+    source_identifiers = _truncate(
+        _join(_identifier_regex.findall(source)),
+        MAX_SEARCH_DOCUMENT_CHARS - len(name) - len(abi_identifiers),
+    )
+    return SearchDocument(name, abi_identifiers, source_identifiers)
+
+
+def search_vector(name, abi_identifiers, source_identifiers):
+    return (
+        _weighted(name, "A")
+        .op("||")(_weighted(abi_identifiers, "B"))
+        .op("||")(_weighted(source_identifiers, "C"))
+    )
+
+
+def _weighted(text, weight: str):
+    return sa.func.setweight(
+        sa.func.to_tsvector("simple", text), sa.literal_column(f"'{weight}'")
+    )
+
+
+def _flatten_sources(source_code_json: str) -> str:
+    if not (source_code_json.startswith("{") and source_code_json.endswith("}")):
+        return source_code_json
+    try:
+        if source_code_json.startswith("{{"):
+            sources = json.loads(source_code_json[1:-1])
+        else:
+            sources = json.loads(source_code_json)
+    except ValueError:
+        return source_code_json
+
+    sources = sources.get("sources", sources)
+    return "\n".join(
+        source["content"]
+        for source in sources.values()
+        if isinstance(source, dict) and "content" in source
+    )
+
+
+def _abi_identifiers(abi: str) -> List[str]:
+    try:
+        entries = json.loads(abi)
+        if isinstance(entries, str):
+            entries = json.loads(entries)
+    except ValueError:
+        return []
+    if not isinstance(entries, list):
+        return []
+    return [
+        entry["name"]
+        for entry in entries
+        if isinstance(entry, dict)
+        and entry.get("type") in ("function", "event", "error")
+        and entry.get("name")
+    ]
+
+
+def _strip_comment(match) -> str:
+    text = match.group(0)
+    return " " if text.startswith("/") else text
+
+
+def _join(identifiers: Iterable[str]) -> str:
+    return " ".join(dict.fromkeys(identifiers))
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 0:
+        return ""
+    end = text.rfind(" ", 0, max_chars + 1)
+    return text[: end if end != -1 else max_chars]
+
+
+def downgrade():
+    op.add_column(
+        "contract_sources",
+        sa.Column(
+            "__ts_vector__",
+            TSVector(),
+            sa.Computed("to_tsvector('simple', abi || source_code)", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_contract_sources___ts_vector__",
+        "contract_sources",
+        ["__ts_vector__"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.drop_index(
+        "ix_contract_sources_search_vector",
+        table_name="contract_sources",
+        postgresql_using="gin",
+    )
+    op.drop_column("contract_sources", "search_vector")
@@ -0,0 +1,195 @@
+"""Create contract sources
+
+Revision ID: e41c7a9d2f58
+Revises: b7e2d4f19c03
+Create Date: 2026-10-18 15:03:52.118904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.types import TypeDecorator
+
+
+class TSVector(TypeDecorator):
+    impl = TSVECTOR
+    cache_ok = True
+
+
+# revision identifiers, used by Alembic.
+revision = "e41c7a9d2f58"
+down_revision = "b7e2d4f19c03"
+branch_labels = None
+depends_on = None
+
+# Must match ContractSource.hash_of
+SOURCE_HASH_SQL = (
+    "encode(sha256(convert_to(abi || chr(31) || source_code, 'UTF8')), 'hex')"
+)
+
+
+def upgrade():
+    op.create_table(
+        "contract_sources",
+        sa.Column("hash", sa.String(), nullable=False),
+        sa.Column("abi", sa.TEXT(), nullable=False),
+        sa.Column("source_code", sa.TEXT(), nullable=False),
+        sa.Column(
+            "__ts_vector__",
+            TSVector(),
+            sa.Computed("to_tsvector('simple', abi || source_code)", persisted=True),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+    # lz4 (Postgres 14+) compresses and decompresses much faster than pglz
+    op.execute("ALTER TABLE contract_sources ALTER COLUMN abi SET COMPRESSION lz4")
+    op.execute(
+        "ALTER TABLE contract_sources ALTER COLUMN source_code SET COMPRESSION lz4"
+    )
+
+    # Store each distinct source once and point contracts at it
+    op.execute(
+        f"""
+        INSERT INTO contract_sources (hash, abi, source_code)
+        SELECT DISTINCT ON (hash) {SOURCE_HASH_SQL} AS hash, abi, source_code
+        FROM contracts
+        """
+    )
+    op.add_column("contracts", sa.Column("source_hash", sa.String(), nullable=True))
+    op.execute(f"UPDATE contracts SET source_hash = {SOURCE_HASH_SQL}")
+    op.alter_column("contracts", "source_hash", nullable=False)
+    op.create_foreign_key(
+        "contracts_source_hash_fkey",
+        "contracts",
+        "contract_sources",
+        ["source_hash"],
+        ["hash"],
+    )
+    op.create_index(
+        op.f("ix_contracts_source_hash"), "contracts", ["source_hash"], unique=False
+    )
+    op.create_index(
+        "ix_contract_sources___ts_vector__",
+        "contract_sources",
+        ["__ts_vector__"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+    # Rekey parsed code units by source, keeping one copy per distinct source
+    op.add_column(
+        "contract_code_units", sa.Column("source_hash", sa.String(), nullable=True)
+    )
+    op.execute(
+        """
+        UPDATE contract_code_units u
+        SET source_hash = c.source_hash
+        FROM contracts c
+        WHERE c.address = u.address
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM contract_code_units u
+        USING contract_code_units d
+        WHERE u.source_hash = d.source_hash AND u.address > d.address
+        """
+    )
+    op.drop_constraint(
+        "contract_code_units_address_fkey", "contract_code_units", type_="foreignkey"
+    )
+    op.drop_constraint(
+        "contract_code_units_pkey", "contract_code_units", type_="primary"
+    )
+    op.drop_column("contract_code_units", "address")
+    op.alter_column("contract_code_units", "source_hash", nullable=False)
+    op.create_primary_key(
+        "contract_code_units_pkey", "contract_code_units", ["source_hash"]
+    )
+    op.create_foreign_key(
+        "contract_code_units_source_hash_fkey",
+        "contract_code_units",
+        "contract_sources",
+        ["source_hash"],
+        ["hash"],
+        ondelete="CASCADE",
+    )
+
+    op.drop_index(
+        "ix_contracts___ts_vector__", table_name="contracts", postgresql_using="gin"
+    )
+    op.drop_column("contracts", "__ts_vector__")
+    op.drop_column("contracts", "source_code")
+    op.drop_column("contracts", "abi")
+
+
+def downgrade():
+    op.add_column("contracts", sa.Column("abi", sa.TEXT(), nullable=True))
+    op.add_column("contracts", sa.Column("source_code", sa.TEXT(), nullable=True))
+    op.execute(
+        """
+        UPDATE contracts c
+        SET abi = s.abi, source_code = s.source_code
+        FROM contract_sources s
+        WHERE s.hash = c.source_hash
+        """
+    )
+    op.alter_column("contracts", "abi", nullable=False)
+    op.alter_column("contracts", "source_code", nullable=False)
+    op.add_column(
+        "contracts",
+        sa.Column(
+            "__ts_vector__",
+            TSVector(),
+            sa.Computed("to_tsvector('simple', abi || source_code)", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_contracts___ts_vector__",
+        "contracts",
+        ["__ts_vector__"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+    op.drop_constraint(
+        "contract_code_units_source_hash_fkey",
+        "contract_code_units",
+        type_="foreignkey",
+    )
+    op.drop_constraint(
+        "contract_code_units_pkey", "contract_code_units", type_="primary"
+    )
+    op.add_column(
+        "contract_code_units", sa.Column("address", sa.String(), nullable=True)
+    )
+    op.execute(
+        """
+        INSERT INTO contract_code_units (address, source_hash, code)
+        SELECT c.address, u.source_hash, u.code
+        FROM contract_code_units u
+        JOIN contracts c ON c.source_hash = u.source_hash
+        """
+    )
+    op.execute("DELETE FROM contract_code_units WHERE address IS NULL")
+    op.drop_column("contract_code_units", "source_hash")
+    op.alter_column("contract_code_units", "address", nullable=False)
+    op.create_primary_key(
+        "contract_code_units_pkey", "contract_code_units", ["address"]
+    )
+    op.create_foreign_key(
+        "contract_code_units_address_fkey",
+        "contract_code_units",
+        "contracts",
+        ["address"],
+        ["address"],
+        ondelete="CASCADE",
+    )
+
+    op.drop_index(op.f("ix_contracts_source_hash"), table_name="contracts")
+    op.drop_constraint("contracts_source_hash_fkey", "contracts", type_="foreignkey")
+    op.drop_column("contracts", "source_hash")
+    op.drop_table("contract_sources")
@@ -0,0 +1,28 @@
+"""Add contracts network id index
+
+Revision ID: f2c7b9e4a318
+Revises: a6d3f8c2e157
+Create Date: 2026-10-18 21:05:37.914462
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "f2c7b9e4a318"
+down_revision = "a6d3f8c2e157"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_contracts_network_id_timestamp_address",
+        "contracts",
+        ["network_id", "timestamp", "address"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_contracts_network_id_timestamp_address", table_name="contracts")
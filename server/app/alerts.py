@@ -0,0 +1,85 @@
+import re
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from app.models import ContractAlert
+from app.settings import settings
+
+# Runs of letters and digits, like the 'simple' text search parser. Hyphenated
+# words are split into their parts, so this can match slightly more than Postgres.
+_lexeme_regex = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    return frozenset(lexeme.lower() for lexeme in _lexeme_regex.findall(text))
+
+
+class AlertMatcher:
+    """Reverse index from alert keywords to chats, matched against new contracts.
+
+    Each alert is indexed under one anchor lexeme (its longest, as a proxy for
+    rarest), so a contract only checks alerts whose anchor it contains.
+    """
+
+    def __init__(self):
+        self._lexemes: Dict[str, FrozenSet[str]] = {}
+        self._chat_ids: Dict[str, Set[int]] = {}
+        self._index: Dict[str, Set[str]] = {}
+        self._loaded_at: Optional[float] = None
+
+    def load(self, alerts: Iterable[ContractAlert]):
+        self._lexemes = {}
+        self._chat_ids = {}
+        self._index = {}
+        for alert in alerts:
+            for chat_id in alert.chat_ids:
+                self.add(alert.keyword, chat_id)
+        self._loaded_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        # Other workers may have changed alerts, so reload from the DB periodically
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at >= settings.alert_index_refresh_sec
+        )
+
+    def add(self, keyword: str, chat_id: int):
+        if keyword not in self._chat_ids:
+            lexemes = tokenize(keyword)
+            if len(lexemes) == 0:
+                return  # plainto_tsquery of no lexemes matches nothing
+            self._lexemes[keyword] = lexemes
+            self._chat_ids[keyword] = set()
+            self._index.setdefault(_anchor(lexemes), set()).add(keyword)
+        self._chat_ids[keyword].add(chat_id)
+
+    def remove(self, keyword: str, chat_id: int):
+        chat_ids = self._chat_ids.get(keyword)
+        if chat_ids is None:
+            return
+        chat_ids.discard(chat_id)
+        if len(chat_ids) == 0:
+            anchor = _anchor(self._lexemes.pop(keyword))
+            del self._chat_ids[keyword]
+            self._index[anchor].discard(keyword)
+            if len(self._index[anchor]) == 0:
+                del self._index[anchor]
+
+    def match(self, lexemes: FrozenSet[str]) -> List[str]:
+        """Keywords whose lexemes all appear in a tokenized contract"""
+        matches = []
+        for lexeme in lexemes:
+            for keyword in self._index.get(lexeme, ()):
+                if self._lexemes[keyword] <= lexemes:
+                    matches.append(keyword)
+        return matches
+
+    def get_chat_ids(self, keyword: str) -> List[int]:
+        return sorted(self._chat_ids.get(keyword, ()))
+
+
+def _anchor(lexemes: FrozenSet[str]) -> str:
+    return max(lexemes, key=lambda lexeme: (len(lexeme), lexeme))
+
+
+alert_matcher = AlertMatcher()
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import List, Optional, Tuple
+
+import app.crud as crud
+from app.database import SessionLocal
+from app.enums import IngestStage, JobStatus, NetworkID
+from app.ingest import BACKFILL_PAYLOAD
+from app.utils import scrape_page
+
+ADDRESS_BATCH_SIZE = 500
+PAGE_MAX_ATTEMPTS = 5
+
+
+async def backfill_pages(
+    network_id: NetworkID, start_page: Optional[int], end_page: Optional[int]
+):
+    """Queue every contract on a network's verified contract pages, resuming
+    from the last checkpointed page unless a start page is given.
+
+    Explorers only list so many pages, the crawl stops at the first empty one.
+    """
+    name = f"pages:{network_id.name}"
+    page = start_page
+    if page is None:
+        async with SessionLocal() as db:
+            page = await crud.get_backfill_checkpoint(db, name) or 1
+
+    while end_page is None or page <= end_page:
+        contracts = await _scrape_page_with_retries(page, network_id)
+        if len(contracts) == 0:
+            break
+        async with SessionLocal() as db:
+            existing = await crud.get_existing_addresses(
+                db, [c.address for c in contracts], network_id
+            )
+            num_queued = await crud.enqueue_ingest_jobs(
+                db,
+                IngestStage.fetch,
+                network_id,
+                {
+                    c.address: dict(
+                        json.loads(c.json(exclude={"abi", "source_code"})),
+                        **BACKFILL_PAYLOAD,
+                    )
+                    for c in contracts
+                    if c.address not in existing
+                },
+            )
+            await crud.set_backfill_checkpoint(db, name, page + 1)
+        logging.info(
+            f"Backfill queued {num_queued} contracts from {network_id.name} page {page}"
+        )
+        page += 1
+
+
+async def backfill_addresses(network_id: NetworkID, addresses: List[str]):
+    """Queue a list of addresses, resuming from the last checkpointed position.
+
+    The checkpoint is keyed by the list's content, so a different list starts
+    over.
+    """
+    addresses = [address.lower() for address in addresses]
+    list_hash = hashlib.sha256("\n".join(addresses).encode()).hexdigest()
+    name = f"addresses:{network_id.name}:{list_hash}"
+    async with SessionLocal() as db:
+        position = await crud.get_backfill_checkpoint(db, name) or 0
+
+    while position < len(addresses):
+        batch = addresses[position : position + ADDRESS_BATCH_SIZE]
+        async with SessionLocal() as db:
+            existing = await crud.get_existing_addresses(db, batch, network_id)
+            # Fetch fills in the metadata that the listing would have provided
+            num_queued = await crud.enqueue_ingest_jobs(
+                db,
+                IngestStage.fetch,
+                network_id,
+                {
+                    address: dict(
+                        address=address,
+                        network_id=network_id.value,
+                        **BACKFILL_PAYLOAD,
+                    )
+                    for address in batch
+                    if address not in existing
+                },
+            )
+            position += len(batch)
+            await crud.set_backfill_checkpoint(db, name, position)
+        logging.info(
+            f"Backfill queued {num_queued} contracts, {position}/{len(addresses)} "
+            "addresses read"
+        )
+
+
+async def report_backfill_progress(discovery: asyncio.Task, interval_sec: float):
+    """Log throughput and an ETA until discovery is done and the queue is drained.
+
+    The ETA only covers contracts queued so far, while pages are still being
+    crawled it grows as more are found.
+    """
+    started_at = time.monotonic()
+    initial_done, _, _ = await _count_backfill_jobs()
+    while True:
+        await asyncio.sleep(interval_sec)
+        done, remaining, dead = await _count_backfill_jobs()
+        rate = (done - initial_done) / (time.monotonic() - started_at)
+        eta = f"{remaining / rate / 60:.1f} min" if rate > 0 else "unknown"
+        logging.info(
+            f"Backfill: {done} done, {remaining} remaining, {dead} dead, "
+            f"{rate:.2f} contracts/sec, ETA {eta}"
+        )
+        if discovery.done() and remaining == 0:
+            return
+
+
+async def _count_backfill_jobs() -> Tuple[int, int, int]:
+    async with SessionLocal() as db:
+        counts = await crud.count_backfill_ingest_jobs(db)
+    # A contract is done once processed, and takes both stages until then
+    done = counts.get((IngestStage.process, JobStatus.done), 0)
+    remaining = sum(
+        counts.get((stage, status), 0)
+        for stage in IngestStage
+        for status in (JobStatus.pending, JobStatus.running)
+    )
+    dead = sum(counts.get((stage, JobStatus.dead), 0) for stage in IngestStage)
+    return done, remaining, dead
+
+
+async def _scrape_page_with_retries(page: int, network_id: NetworkID):
+    for attempt in range(PAGE_MAX_ATTEMPTS):
+        try:
+            return await scrape_page(page, network_id)
+        except Exception as e:
+            logging.warning(f"Failed to scrape page {page}: {e}")
+            await asyncio.sleep(2 ** attempt)
+    raise Exception(f"Gave up scraping page {page}, rerun to resume from it")
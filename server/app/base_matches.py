@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple
+
+import app.crud as crud
+from app.database import SessionLocal
+from app.diff import base_contract_registry
+from app.diff_service import BaseMatch, DiffService, diff_service
+from app.enums import NetworkID
+
+# Corpus version every stored match is known to be computed against
+_current_corpus_version: Optional[str] = None
+# Corpus version of the pass in progress, and the last contract it went through
+_pass_corpus_version: Optional[str] = None
+_pass_position: Optional[Tuple[datetime, str]] = None
+
+
+async def update_base_matches(
+    contracts: Sequence,
+    corpus_version: Optional[str] = None,
+    service: DiffService = diff_service,
+) -> Dict[Tuple[NetworkID, str], BaseMatch]:
+    """Compute and store the closest base contract of each contract, by
+    (network_id, address).
+
+    Takes rows with a network_id, address, name and source_hash. Contracts that share a
+    source and name are only diffed once, and not at all if another contract
+    with that source and name was already matched against this corpus.
+    """
+    if len(contracts) == 0:
+        return {}
+    if corpus_version is None:
+        corpus_version = base_contract_registry.version
+
+    code_keys = list({(c.source_hash, c.name) for c in contracts})
+    async with SessionLocal() as db:
+        code_key_to_match = await crud.get_stored_base_matches(
+            db, code_keys, corpus_version
+        )
+        code_keys = [key for key in code_keys if key not in code_key_to_match]
+        hash_to_code = await crud.get_code_units_by_hashes(
+            db, list({source_hash for source_hash, _ in code_keys})
+        )
+    matches = await service.get_base_matches(
+        [hash_to_code.get(source_hash, {}).get(name) for source_hash, name in code_keys]
+    )
+    code_key_to_match.update(zip(code_keys, matches))
+    key_to_match = {
+        (c.network_id, c.address): code_key_to_match[(c.source_hash, c.name)]
+        for c in contracts
+    }
+
+    async with SessionLocal() as db:
+        await crud.save_base_matches(db, key_to_match, corpus_version)
+    return key_to_match
+
+
+async def refresh_stale_base_matches(
+    limit: int, service: DiffService = diff_service
+) -> int:
+    """Recompute up to `limit` matches left stale by a base contract change.
+
+    Each pass walks the stale contracts once, newest first, so contracts that
+    fail to match don't hold it up. They are retried by the next pass, after
+    a base contract change or a restart.
+    """
+    global _current_corpus_version, _pass_corpus_version, _pass_position
+
+    # Read the version first, so a change mid-batch is picked up next time
+    corpus_version = base_contract_registry.version
+    if corpus_version == _current_corpus_version:
+        return 0
+    if corpus_version != _pass_corpus_version:
+        _pass_corpus_version, _pass_position = corpus_version, None
+    async with SessionLocal() as db:
+        contracts = await crud.get_stale_base_matches(
+            db, corpus_version, limit=limit, before=_pass_position
+        )
+    await update_base_matches(contracts, corpus_version, service)
+    if len(contracts) < limit:
+        _current_corpus_version = corpus_version
+        _pass_corpus_version, _pass_position = None, None
+    else:
+        _pass_position = (contracts[-1].timestamp, contracts[-1].address)
+    return len(contracts)
@@ -2,17 +2,15 @@ import json
 import logging
 from typing import List, Optional, Tuple
 
-from sqlalchemy.orm import Session
-from telegram.bot import Bot
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud
-from app.database import get_db
+from app.alerts import alert_matcher
+from app.database import SessionLocal
+from app.delivery import delivery_queue
 from app.settings import settings
 from app.web import post_async
 
-bot = Bot(token=settings.telegram_bot_token)
-
-
 TELEGRAM_SET_WEBHOOK_URL = "https://api.telegram.org/bot{token}/setWebhook"
 VALID_COMMANDS = ["start", "sub", "unsub", "registered"]
 
@@ -32,28 +30,26 @@ async def set_telegram_webhook_url():
 
 
 def send_message(chat_id: int, message: str, parse_mode: Optional[str] = "Markdown"):
-    bot.send_message(
-        chat_id, message, parse_mode=parse_mode, disable_web_page_preview=True
-    )
+    delivery_queue.enqueue(chat_id, message, parse_mode=parse_mode)
 
 
-def handle_commands(chat_id: int, text: str):
-    command, args = _parse_command(text)
+async def handle_commands(chat_id: int, text: str):
+    command, args = parse_command(text)
     if not command:
         send_message(chat_id, "Unrecognized command 😿")
 
-    db = next(get_db())
-    if command == "start":
-        send_message(chat_id, "hello frens!")
-    elif command == "sub":
-        _handle_sub(db, chat_id, args)
-    elif command == "unsub":
-        _handle_unsub(db, chat_id, args)
-    elif command == "registered":
-        _handle_registered(db, chat_id)
+    async with SessionLocal() as db:
+        if command == "start":
+            send_message(chat_id, "hello frens!")
+        elif command == "sub":
+            await _handle_sub(db, chat_id, args)
+        elif command == "unsub":
+            await _handle_unsub(db, chat_id, args)
+        elif command == "registered":
+            await _handle_registered(db, chat_id)
 
 
-def _parse_command(text: str) -> Tuple[Optional[str], List[str]]:
+def parse_command(text: str) -> Tuple[Optional[str], List[str]]:
     # Returns command and args if valid, otherwise None
     tokens = [token for token in text.strip().split() if token != ""]
     if len(tokens) == 0:
@@ -67,34 +63,36 @@ def _parse_command(text: str) -> Tuple[Optional[str], List[str]]:
     return None, []
 
 
-def _handle_sub(db: Session, chat_id: int, args: List[str]):
+async def _handle_sub(db: AsyncSession, chat_id: int, args: List[str]):
     if len(args) == 0:
         send_message(chat_id, "Please provide a keyword to subscribe to")
         return
 
     keyword = " ".join(args)
-    alert = crud.add_contract_alert(db, keyword, chat_id)
+    alert = await crud.add_contract_alert(db, keyword, chat_id)
     if alert:
+        alert_matcher.add(keyword, chat_id)
         send_message(chat_id, f"Added alert for `{keyword}`")
     else:
         send_message(chat_id, f"Alert already exists for `{keyword}`")
 
 
-def _handle_unsub(db: Session, chat_id: int, args: List[str]):
+async def _handle_unsub(db: AsyncSession, chat_id: int, args: List[str]):
     if len(args) == 0:
         send_message(chat_id, "Please provide a keyword to unsubscribe to")
         return
 
     keyword = " ".join(args)
-    removed = crud.remove_contract_alert(db, keyword, chat_id)
+    removed = await crud.remove_contract_alert(db, keyword, chat_id)
     if removed:
+        alert_matcher.remove(keyword, chat_id)
         send_message(chat_id, f"Removed alert for `{keyword}`")
     else:
         send_message(chat_id, f"No alert exists for `{keyword}`")
 
 
-def _handle_registered(db: Session, chat_id: int):
-    alerts = crud.get_registered_contract_alerts(db, chat_id)
+async def _handle_registered(db: AsyncSession, chat_id: int):
+    alerts = await crud.get_registered_contract_alerts(db, chat_id)
     keywords = [alert.keyword for alert in alerts]
     if len(keywords) > 0:
         keyword_str = ", ".join(keywords)
@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Dict, List, Optional
+
+from sqlalchemy import select
+
+from app import crud
+from app.backfill import (
+    backfill_addresses,
+    backfill_pages,
+    report_backfill_progress,
+)
+from app.base_matches import refresh_stale_base_matches
+from app.database import SessionLocal, engine
+from app.delivery import delivery_queue
+from app.diff import base_contract_registry, parse_source_code
+from app.diff_service import DiffService, diff_service
+from app.enums import IngestStage, NetworkID
+from app.explorers import get_scrape_networks
+from app.ingest import (
+    IngestWorker,
+    fetch_contracts_stage,
+    fetch_worker,
+    process_contracts_stage,
+    process_worker,
+)
+from app.models import ContractCodeUnits, ContractSource
+from app.search import make_search_document
+from app.settings import settings
+from app.utils import scraper_election
+from app.web import close_session
+
+BACKFILL_REPORT_SEC = 30
+
+
+async def backfill_code_units(batch_size: int, workers: int):
+    """Parse and store code units for contracts ingested before parse-once storage"""
+    loop = asyncio.get_event_loop()
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            async with SessionLocal() as db:
+                result = await db.execute(
+                    select(ContractSource.hash, ContractSource.source_code)
+                    .outerjoin(
+                        ContractCodeUnits,
+                        ContractCodeUnits.source_hash == ContractSource.hash,
+                    )
+                    .where(ContractCodeUnits.source_hash.is_(None))
+                    .limit(batch_size)
+                )
+                rows = result.all()
+                if len(rows) == 0:
+                    break
+
+                codes = await asyncio.gather(
+                    *[
+                        loop.run_in_executor(executor, _parse_or_empty, r.source_code)
+                        for r in rows
+                    ]
+                )
+                await crud.save_contract_code_units(
+                    db, {r.hash: code for r, code in zip(rows, codes)}
+                )
+            total += len(rows)
+            logging.info(f"Backfilled code units for {total} sources")
+
+
+async def backfill_base_matches(batch_size: int, workers: int):
+    """Store the closest base contract of contracts that have none, or whose
+    match was computed against an older set of base contracts"""
+    base_contract_registry.load()
+    service = DiffService(workers, settings.diff_timeout_sec)
+    total = 0
+    try:
+        while True:
+            num_updated = await refresh_stale_base_matches(batch_size, service)
+            total += num_updated
+            logging.info(f"Backfilled base contract matches for {total} contracts")
+            if num_updated < batch_size:
+                break
+    finally:
+        service.shutdown()
+
+
+async def reindex_search(batch_size: int, workers: int, reindex_all: bool):
+    """Store search vectors for sources that have none, or rebuild every one
+    after a change to app.search"""
+    loop = asyncio.get_event_loop()
+    total = 0
+    after_hash = "" if reindex_all else None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            async with SessionLocal() as db:
+                rows = await crud.get_unindexed_sources(
+                    db, batch_size, after_hash=after_hash
+                )
+                if len(rows) == 0:
+                    break
+
+                documents = await asyncio.gather(
+                    *[
+                        loop.run_in_executor(
+                            executor, make_search_document, r.abi, r.source_code
+                        )
+                        for r in rows
+                    ]
+                )
+                await crud.save_search_documents(
+                    db, {r.hash: document for r, document in zip(rows, documents)}
+                )
+            if reindex_all:
+                after_hash = rows[-1].hash
+            total += len(rows)
+            logging.info(f"Indexed {total} sources for search")
+
+
+async def run_scraper(discover: bool, stages: List[IngestStage]):
+    """Scrape in this process instead of the API workers (API_RUNS_SCRAPER=false).
+
+    Several scraper processes can run at once, the advisory lock keeps all but
+    one on standby for discovery while every one of them drains the job queue.
+    """
+    if discover:
+        get_scrape_networks()
+    base_contract_registry.load()
+    diff_service.start()
+    delivery_queue.start()
+    workers = [
+        worker for worker in (fetch_worker, process_worker) if worker.stage in stages
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        if discover:
+            await scraper_election.run()
+        else:
+            await asyncio.Event().wait()
+    finally:
+        for worker in workers:
+            await worker.stop()
+        await delivery_queue.stop()
+        await close_session()
+        diff_service.shutdown()
+        await engine.dispose()
+
+
+async def run_backfill(discover: Awaitable, workers: int):
+    """Crawl or import history through the ingest queue.
+
+    Fetching draws on the same explorer rate budgets as the scraper's fetch
+    workers.
+    """
+    base_contract_registry.load()
+    diff_service.start()
+    fetcher = IngestWorker(
+        IngestStage.fetch, fetch_contracts_stage, workers, settings.ingest_batch_size,
+    )
+    # Live contracts are left to the scraper's process workers, which send
+    # their alerts
+    process = IngestWorker(
+        IngestStage.process,
+        process_contracts_stage,
+        settings.ingest_process_workers,
+        settings.ingest_batch_size,
+        backfill_only=True,
+    )
+    fetcher.start()
+    process.start()
+    discovery = asyncio.get_event_loop().create_task(discover)
+    try:
+        await report_backfill_progress(discovery, BACKFILL_REPORT_SEC)
+        # Surface a crawl that gave up, after the queued work has drained
+        await discovery
+    finally:
+        discovery.cancel()
+        await fetcher.stop()
+        await process.stop()
+        await close_session()
+        diff_service.shutdown()
+        await engine.dispose()
+
+
+async def requeue_dead_jobs(stage: Optional[IngestStage]):
+    async with SessionLocal() as db:
+        num_requeued = await crud.requeue_dead_ingest_jobs(db, stage)
+    logging.info(f"Requeued {num_requeued} dead ingest jobs")
+
+
+def _parse_or_empty(source_code: str) -> Dict[str, str]:
+    # Unparseable sources are stored empty so the backfill doesn't revisit them
+    try:
+        return parse_source_code(source_code)
+    except Exception as e:
+        logging.error(e)
+        return {}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_code = subparsers.add_parser(
+        "backfill-code", help="Parse code units for sources that have none stored"
+    )
+    backfill_code.add_argument("--batch-size", type=int, default=100)
+    backfill_code.add_argument("--workers", type=int, default=settings.diff_workers)
+
+    backfill_base = subparsers.add_parser(
+        "backfill-base-matches",
+        help="Compute closest base contracts for contracts missing or stale ones",
+    )
+    backfill_base.add_argument("--batch-size", type=int, default=100)
+    backfill_base.add_argument("--workers", type=int, default=settings.diff_workers)
+
+    reindex = subparsers.add_parser(
+        "reindex-search", help="Build search vectors for sources that have none"
+    )
+    reindex.add_argument("--batch-size", type=int, default=100)
+    reindex.add_argument("--workers", type=int, default=settings.diff_workers)
+    reindex.add_argument(
+        "--all", action="store_true", help="Rebuild every source's search vector"
+    )
+
+    subparsers.add_parser("scrape", help="Run the scraper outside the API workers")
+
+    ingest_worker = subparsers.add_parser(
+        "ingest-worker", help="Only drain the ingest job queue, e.g. on extra nodes"
+    )
+    ingest_worker.add_argument(
+        "--stage", choices=[stage.value for stage in IngestStage], default=None
+    )
+
+    backfill_history = subparsers.add_parser(
+        "backfill-history",
+        help="Load older verified contracts without alerts, resuming where it left off",
+    )
+    backfill_history.add_argument(
+        "--network",
+        choices=[network_id.name for network_id in NetworkID],
+        default=NetworkID.fantom.name,
+    )
+    backfill_history.add_argument("--start-page", type=int, default=None)
+    backfill_history.add_argument("--end-page", type=int, default=None)
+    backfill_history.add_argument(
+        "--addresses-file",
+        default=None,
+        help="Import the addresses listed one per line instead of crawling pages",
+    )
+    backfill_history.add_argument(
+        "--workers", type=int, default=settings.ingest_fetch_workers
+    )
+
+    requeue_dead = subparsers.add_parser(
+        "requeue-dead", help="Retry ingest jobs that ran out of attempts"
+    )
+    requeue_dead.add_argument(
+        "--stage", choices=[stage.value for stage in IngestStage], default=None
+    )
+
+    args = parser.parse_args()
+    if args.command == "scrape":
+        asyncio.run(run_scraper(True, list(IngestStage)))
+    elif args.command == "ingest-worker":
+        stages = [IngestStage(args.stage)] if args.stage else list(IngestStage)
+        asyncio.run(run_scraper(False, stages))
+    elif args.command == "backfill-history":
+        network_id = NetworkID[args.network]
+        if args.addresses_file:
+            with open(args.addresses_file) as f:
+                addresses = [line.strip() for line in f if line.strip()]
+            discover = backfill_addresses(network_id, addresses)
+        else:
+            discover = backfill_pages(network_id, args.start_page, args.end_page)
+        asyncio.run(run_backfill(discover, args.workers))
+    elif args.command == "requeue-dead":
+        stage = IngestStage(args.stage) if args.stage else None
+        asyncio.run(requeue_dead_jobs(stage))
+    elif args.command == "backfill-code":
+        asyncio.run(backfill_code_units(args.batch_size, args.workers))
+    elif args.command == "backfill-base-matches":
+        asyncio.run(backfill_base_matches(args.batch_size, args.workers))
+    elif args.command == "reindex-search":
+        asyncio.run(reindex_search(args.batch_size, args.workers, args.all))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+
+from app.bot import VALID_COMMANDS, handle_commands, parse_command
+from app.metrics import counter, gauge, histogram
+from app.settings import settings
+
+commands_duplicate = counter("telegram_commands_duplicate")
+commands_dropped = counter("telegram_commands_dropped")
+command_queue_wait = histogram("telegram_command_queue_wait_sec")
+command_latency = {
+    command: histogram(f"telegram_command_latency_sec.{command}")
+    for command in VALID_COMMANDS + ["unknown"]
+}
+
+
+class CommandUpdate(NamedTuple):
+    update_id: Optional[int]
+    chat_id: int
+    text: str
+    enqueued_at: float
+
+
+class CommandQueue:
+    """Bounded queue of Telegram commands drained by background workers.
+
+    The webhook only enqueues, so Telegram gets its response immediately.
+    Updates are deduplicated by update_id in case Telegram redelivers them.
+    """
+
+    def __init__(self, num_workers: int, max_size: int, dedupe_size: int = 10000):
+        self.num_workers = num_workers
+        self.max_size = max_size
+        self.dedupe_size = dedupe_size
+        self._seen_update_ids: OrderedDict = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self):
+        if len(self._workers) > 0:
+            return
+        loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._workers = [
+            loop.create_task(self._worker()) for _ in range(self.num_workers)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, update_id: Optional[int], chat_id: int, text: str) -> bool:
+        """Queue a command, returns False if the queue is full"""
+        if update_id is not None and update_id in self._seen_update_ids:
+            commands_duplicate.inc()
+            return True
+
+        try:
+            self._queue.put_nowait(
+                CommandUpdate(update_id, chat_id, text, time.monotonic())
+            )
+        except asyncio.QueueFull:
+            commands_dropped.inc()
+            return False
+
+        if update_id is not None:
+            self._seen_update_ids[update_id] = None
+            if len(self._seen_update_ids) > self.dedupe_size:
+                self._seen_update_ids.popitem(last=False)
+        return True
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            started_at = time.monotonic()
+            command_queue_wait.observe(started_at - update.enqueued_at)
+            command, _ = parse_command(update.text)
+            try:
+                await handle_commands(update.chat_id, update.text)
+            except Exception as e:
+                logging.error(e)
+            finally:
+                command_latency[command or "unknown"].observe(
+                    time.monotonic() - started_at
+                )
+
+
+command_queue = CommandQueue(settings.command_workers, settings.command_queue_size)
+gauge("telegram_command_queue_depth", lambda: command_queue.depth)
@@ -1,2 +1,9 @@
+from .backfill_checkpoint import *
+from .base_match import *
 from .contract import *
-from .contract_alert import *
\ No newline at end of file
+from .contract_alert import *
+from .contract_code_units import *
+from .contract_diff import *
+from .contract_source import *
+from .ingest_job import *
+from .scrape_watermark import *
@@ -0,0 +1,26 @@
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import BackfillCheckpoint
+
+
+async def get_backfill_checkpoint(db: AsyncSession, name: str) -> Optional[int]:
+    result = await db.execute(
+        select(BackfillCheckpoint.position).where(BackfillCheckpoint.name == name)
+    )
+    return result.scalar()
+
+
+async def set_backfill_checkpoint(db: AsyncSession, name: str, position: int):
+    stmt = insert(BackfillCheckpoint).values(
+        name=name, position=position, updated_at=func.now()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BackfillCheckpoint.name],
+        set_=dict(position=stmt.excluded.position, updated_at=func.now()),
+    )
+    await db.execute(stmt)
+    await db.commit()
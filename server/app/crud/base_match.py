@@ -0,0 +1,114 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.diff_service import BaseMatch
+from app.enums import NetworkID
+from app.models import Contract
+
+
+async def get_stale_base_matches(
+    db: AsyncSession,
+    corpus_version: str,
+    keys: Optional[List[Tuple[NetworkID, str]]] = None,
+    limit: Optional[int] = None,
+    before: Optional[Tuple[datetime, str]] = None,
+):
+    """Network, address, name, source hash and timestamp of contracts whose
+    closest base contract is missing or was computed against another base
+    contract corpus, optionally only those with the given (network_id, address),
+    newest first and older than the (timestamp, address) `before` if given"""
+    stmt = select(
+        Contract.network_id,
+        Contract.address,
+        Contract.name,
+        Contract.source_hash,
+        Contract.timestamp,
+    ).where(
+        or_(
+            Contract.base_corpus_version.is_(None),
+            Contract.base_corpus_version != corpus_version,
+        )
+    )
+    if keys is not None:
+        stmt = stmt.where(
+            tuple_(Contract.network_id, Contract.address).in_(
+                [(network_id, addr.lower()) for network_id, addr in keys]
+            )
+        )
+    if before is not None:
+        stmt = stmt.where(tuple_(Contract.timestamp, Contract.address) < before)
+    if limit is not None:
+        stmt = stmt.order_by(Contract.timestamp.desc(), Contract.address.desc()).limit(
+            limit
+        )
+    result = await db.execute(stmt)
+    return result.all()
+
+
+async def get_stored_base_matches(
+    db: AsyncSession, code_keys: List[Tuple[str, str]], corpus_version: str
+) -> Dict[Tuple[str, str], BaseMatch]:
+    """Matches already computed against `corpus_version` for any contract with
+    the given (source_hash, name), such as an earlier fork of the same source"""
+    if len(code_keys) == 0:
+        return {}
+    result = await db.execute(
+        select(
+            Contract.source_hash,
+            Contract.name,
+            Contract.closest_base_contract,
+            Contract.closest_base_diffs,
+        )
+        .where(
+            tuple_(Contract.source_hash, Contract.name).in_(code_keys),
+            Contract.base_corpus_version == corpus_version,
+        )
+        .distinct(Contract.source_hash, Contract.name)
+    )
+    return {
+        (source_hash, name): BaseMatch(base_name, num_diffs)
+        for source_hash, name, base_name, num_diffs in result.all()
+    }
+
+
+async def save_base_matches(
+    db: AsyncSession,
+    key_to_match: Dict[Tuple[NetworkID, str], BaseMatch],
+    corpus_version: str,
+):
+    """Store matches by (network_id, address) as computed against
+    `corpus_version`. Failed matches are stored without a version, so they stay
+    stale and are retried."""
+    if len(key_to_match) == 0:
+        return
+
+    table = Contract.__table__
+    stmt = (
+        update(table)
+        .where(
+            table.c.network_id == bindparam("match_network_id"),
+            table.c.address == bindparam("match_address"),
+        )
+        .values(
+            closest_base_contract=bindparam("match_name"),
+            closest_base_diffs=bindparam("match_diffs"),
+            base_corpus_version=bindparam("match_version"),
+        )
+    )
+    await db.execute(
+        stmt,
+        [
+            dict(
+                match_network_id=network_id,
+                match_address=address,
+                match_name=match.name,
+                match_diffs=match.num_diffs,
+                match_version=None if match.num_diffs is None else corpus_version,
+            )
+            for (network_id, address), match in key_to_match.items()
+        ],
+    )
+    await db.commit()
@@ -1,60 +1,326 @@
-from typing import List
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Set, Tuple
 
-from app.models import Contract
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager, joinedload, load_only
+from sqlalchemy.sql import Select
+
+from app.enums import NetworkID
+from app.models import Contract, ContractSource
+from app.pagination import Cursor
 from app.schemas import VerifiedContract
-from app.web import MAX_FETCH_LIMIT
+from app.web import MAX_FETCH_LIMIT, MAX_STREAM_LIMIT
+
+STREAM_BATCH_SIZE = 100
+
+CONTRACT_METADATA_COLUMNS = (
+    Contract.address,
+    Contract.name,
+    Contract.compiler,
+    Contract.version,
+    Contract.verified_date,
+    Contract.network_id,
+    Contract.timestamp,
+    Contract.license,
+    Contract.closest_base_contract,
+    Contract.closest_base_diffs,
+)
+
+
+async def get_contract(
+    db: AsyncSession, address: str, network_id: Optional[NetworkID] = None
+):
+    """Contract at the address on the network, or the first one stored at the
+    address on any network"""
+    result = await db.execute(
+        _where_address(
+            select(Contract).options(joinedload(Contract.source)), address, network_id
+        )
+    )
+    return result.scalars().first()
+
+
+async def get_contract_source_key(
+    db: AsyncSession, address: str, network_id: Optional[NetworkID] = None
+):
+    """Name and source hash of a contract, without loading the source"""
+    result = await db.execute(
+        _where_address(select(Contract.name, Contract.source_hash), address, network_id)
+    )
+    return result.first()
+
 
+def _where_address(
+    stmt: Select, address: str, network_id: Optional[NetworkID]
+) -> Select:
+    stmt = stmt.where(Contract.address == address.lower())
+    if network_id is not None:
+        stmt = stmt.where(Contract.network_id == network_id)
+    return stmt.order_by(Contract.timestamp.asc())
 
-def get_contract(db: Session, address: str):
-    return db.query(Contract).filter(Contract.address == address.lower()).first()
+
+async def get_contracts_by_keys(
+    db: AsyncSession, keys: List[Tuple[NetworkID, str]]
+) -> List[Contract]:
+    """Contracts by (network_id, address)"""
+    keys = [(network_id, addr.lower()) for network_id, addr in keys]
+    if len(keys) == 0:
+        return []
+    result = await db.execute(
+        select(Contract)
+        .options(joinedload(Contract.source))
+        .where(tuple_(Contract.network_id, Contract.address).in_(keys))
+    )
+    return result.scalars().all()
 
 
-def get_contracts_by_addresses(db: Session, addresses: List[str]):
+async def get_existing_addresses(
+    db: AsyncSession, addresses: List[str], network_id: NetworkID
+) -> Set[str]:
+    """Addresses already stored for the network"""
     addresses = [addr.lower() for addr in addresses]
-    return db.query(Contract).filter(Contract.address.in_(addresses))
+    if len(addresses) == 0:
+        return set()
+    result = await db.execute(
+        select(Contract.address).where(
+            Contract.address.in_(addresses), Contract.network_id == network_id
+        )
+    )
+    return set(result.scalars().all())
+
 
+async def create_contracts(
+    db: AsyncSession,
+    contracts: List[VerifiedContract],
+    timestamps: Optional[List[datetime]] = None,
+) -> List[Tuple[NetworkID, str]]:
+    """Insert contracts in bulk, skipping addresses already stored for their
+    network.
 
-def create_contract(db: Session, contract: VerifiedContract):
-    db_contract = Contract(
-        address=contract.address.lower(),
-        name=contract.name,
-        compiler=contract.compiler,
-        version=contract.version,
-        verified_date=contract.verified_date,
-        abi=contract.abi,
-        source_code=contract.source_code,
-        network_id=contract.network_id,
-        license=contract.license,
+    Rows are stamped with the given timestamps, or in list order so timestamp
+    ordering matches insertion order.
+    Sources are stored once per distinct content hash. Returns the (network_id,
+    address) of the contracts that were actually inserted.
+    """
+    if len(contracts) == 0:
+        return []
+
+    sources = {}
+    source_hashes = []
+    for contract in contracts:
+        source_hash = ContractSource.hash_of(contract.abi, contract.source_code)
+        sources.setdefault(
+            source_hash,
+            dict(hash=source_hash, abi=contract.abi, source_code=contract.source_code),
+        )
+        source_hashes.append(source_hash)
+    await db.execute(
+        insert(ContractSource)
+        .values(list(sources.values()))
+        .on_conflict_do_nothing(index_elements=[ContractSource.hash])
     )
-    db.add(db_contract)
-    db.commit()
-    db.refresh(db_contract)
-    return db_contract
 
+    values = [
+        dict(
+            address=contract.address.lower(),
+            name=contract.name,
+            compiler=contract.compiler,
+            version=contract.version,
+            verified_date=contract.verified_date,
+            source_hash=source_hash,
+            network_id=contract.network_id,
+            license=contract.license,
+            timestamp=(
+                timestamps[i]
+                if timestamps is not None
+                else func.now() + timedelta(microseconds=i)
+            ),
+        )
+        for i, (contract, source_hash) in enumerate(zip(contracts, source_hashes))
+    ]
+    stmt = (
+        insert(Contract)
+        .values(values)
+        .on_conflict_do_nothing(index_elements=[Contract.address, Contract.network_id])
+        .returning(Contract.network_id, Contract.address)
+    )
+    result = await db.execute(stmt)
+    inserted = [tuple(row) for row in result.all()]
+    await db.commit()
+    return inserted
 
-def get_contracts(
-    db: Session, skip: int = 0, limit: int = 100, most_recent: bool = True
-):
+
+async def create_contract(db: AsyncSession, contract: VerifiedContract):
+    await create_contracts(db, [contract])
+    return await get_contract(db, contract.address, contract.network_id)
+
+
+async def get_contracts(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    most_recent: bool = True,
+    cursor: Optional[Cursor] = None,
+    include_contract_data: bool = True,
+    closest_to: Optional[str] = None,
+    most_similar: bool = False,
+    network_id: Optional[NetworkID] = None,
+) -> List[Contract]:
     limit = min(limit, MAX_FETCH_LIMIT)
-    order_clause = (
-        Contract.timestamp.desc() if most_recent else Contract.timestamp.asc()
+    stmt = _paginate(
+        _select_contracts(include_contract_data, closest_to, network_id),
+        skip,
+        limit,
+        most_recent,
+        cursor,
+        most_similar,
     )
-    return db.query(Contract).order_by(order_clause).offset(skip).limit(limit)
+    result = await db.execute(stmt)
+    return result.scalars().all()
 
 
-def search_contracts(
-    db: Session, query: str, skip: int = 0, limit: int = 100, most_recent: bool = True
-):
+async def search_contracts(
+    db: AsyncSession,
+    query: str,
+    skip: int = 0,
+    limit: int = 100,
+    most_recent: bool = True,
+    cursor: Optional[Cursor] = None,
+    include_contract_data: bool = True,
+    closest_to: Optional[str] = None,
+    most_similar: bool = False,
+    network_id: Optional[NetworkID] = None,
+    order_by_rank: bool = False,
+) -> List[Contract]:
     limit = min(limit, MAX_FETCH_LIMIT)
-    order_clause = (
-        Contract.timestamp.desc() if most_recent else Contract.timestamp.asc()
+    stmt = _paginate(
+        _search(
+            _select_contracts(
+                include_contract_data, closest_to, network_id, order_by_rank
+            ),
+            query,
+            order_by_rank,
+        ),
+        skip,
+        limit,
+        most_recent,
+        cursor,
+        most_similar,
+        Contract.search_rank(query) if order_by_rank else None,
     )
-    return (
-        db.query(Contract)
-        .filter(Contract.search(query))
-        .order_by(order_clause)
-        .offset(skip)
-        .limit(limit)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def stream_contracts(
+    db: AsyncSession,
+    query: Optional[str] = None,
+    skip: int = 0,
+    limit: int = MAX_STREAM_LIMIT,
+    most_recent: bool = True,
+    cursor: Optional[Cursor] = None,
+    include_contract_data: bool = True,
+    closest_to: Optional[str] = None,
+    most_similar: bool = False,
+    network_id: Optional[NetworkID] = None,
+    order_by_rank: bool = False,
+) -> AsyncIterator[Contract]:
+    """Yield listing or search results through a server-side cursor.
+
+    Rows are fetched STREAM_BATCH_SIZE at a time, so memory stays flat no
+    matter how many rows match.
+    """
+    limit = min(limit, MAX_STREAM_LIMIT)
+    order_by_rank = order_by_rank and query is not None
+    stmt = _select_contracts(
+        include_contract_data, closest_to, network_id, order_by_rank
     )
+    rank = None
+    if query is not None:
+        stmt = _search(stmt, query, order_by_rank)
+        if order_by_rank:
+            rank = Contract.search_rank(query)
+    stmt = _paginate(
+        stmt, skip, limit, most_recent, cursor, most_similar, rank
+    ).execution_options(yield_per=STREAM_BATCH_SIZE)
+    result = await db.stream(stmt)
+    async for contract in result.scalars():
+        yield contract
+
+
+def _select_contracts(
+    include_contract_data: bool,
+    closest_to: Optional[str],
+    network_id: Optional[NetworkID],
+    join_source: bool = False,
+) -> Select:
+    # abi and source_code are often hundreds of KB each, so metadata-only
+    # listings leave them out of the SELECT entirely
+    if join_source:
+        # Ranking reads the source's search vector, and the same join loads
+        # the contract data
+        stmt = select(Contract).join(Contract.source)
+        if include_contract_data:
+            stmt = stmt.options(contains_eager(Contract.source))
+        else:
+            stmt = stmt.options(load_only(*CONTRACT_METADATA_COLUMNS))
+    elif include_contract_data:
+        stmt = select(Contract).options(joinedload(Contract.source))
+    else:
+        stmt = select(Contract).options(load_only(*CONTRACT_METADATA_COLUMNS))
+    if closest_to is not None:
+        stmt = stmt.where(Contract.closest_base_contract == closest_to)
+    if network_id is not None:
+        stmt = stmt.where(Contract.network_id == network_id)
+    return stmt
+
+
+def _search(stmt: Select, query: str, order_by_rank: bool) -> Select:
+    if order_by_rank:
+        # The source is joined by _select_contracts
+        return stmt.where(
+            ContractSource.search_vector.op("@@")(func.plainto_tsquery("simple", query))
+        )
+    return stmt.where(Contract.search(query))
+
+
+def _paginate(
+    stmt: Select,
+    skip: int,
+    limit: int,
+    most_recent: bool,
+    cursor: Optional[Cursor],
+    most_similar: bool = False,
+    rank=None,
+) -> Select:
+    """Order by (timestamp, address) and seek past the cursor if one is given.
+
+    Seeking walks ix_contracts_timestamp_address from the cursor, or
+    ix_contracts_network_id_timestamp_address within a network, so every page
+    costs the same. Offset is kept for older clients and ignored with a cursor.
+    Ordering by fewest diffs to the closest base contract, or by search rank,
+    only supports offsets.
+    """
+    if rank is not None:
+        stmt = stmt.order_by(rank.desc(), Contract.address.asc())
+        return stmt.offset(skip).limit(limit)
+    if most_similar:
+        stmt = stmt.order_by(
+            Contract.closest_base_diffs.asc().nullslast(), Contract.address.asc()
+        )
+        return stmt.offset(skip).limit(limit)
+
+    key = tuple_(Contract.timestamp, Contract.address)
+    if most_recent:
+        stmt = stmt.order_by(Contract.timestamp.desc(), Contract.address.desc())
+    else:
+        stmt = stmt.order_by(Contract.timestamp.asc(), Contract.address.asc())
+
+    if cursor is not None:
+        position = tuple_(cursor.timestamp, cursor.address)
+        stmt = stmt.where(key < position if most_recent else key > position)
+    elif skip > 0:
+        stmt = stmt.offset(skip)
+    return stmt.limit(limit)
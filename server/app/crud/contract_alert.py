@@ -1,17 +1,29 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.attributes import flag_modified
 
 from app.models import ContractAlert
 
 
-def get_registered_contract_alerts(db: Session, chat_id: int):
-    return (
-        db.query(ContractAlert).filter(ContractAlert.chat_ids.contains([chat_id])).all()
+async def get_active_contract_alerts(db: AsyncSession):
+    result = await db.execute(
+        select(ContractAlert).where(ContractAlert.chat_ids != "{}")
     )
+    return result.scalars().all()
 
 
-def add_contract_alert(db: Session, keyword: str, chat_id: int):
-    alert = db.query(ContractAlert).filter(ContractAlert.keyword == keyword).first()
+async def get_registered_contract_alerts(db: AsyncSession, chat_id: int):
+    result = await db.execute(
+        select(ContractAlert).where(ContractAlert.chat_ids.contains([chat_id]))
+    )
+    return result.scalars().all()
+
+
+async def add_contract_alert(db: AsyncSession, keyword: str, chat_id: int):
+    result = await db.execute(
+        select(ContractAlert).where(ContractAlert.keyword == keyword)
+    )
+    alert = result.scalars().first()
     if alert:
         if chat_id not in alert.chat_ids:
             alert.chat_ids.append(chat_id)
@@ -21,22 +33,22 @@ def add_contract_alert(db: Session, keyword: str, chat_id: int):
     else:
         alert = ContractAlert(keyword=keyword, chat_ids=[chat_id])
         db.add(alert)
-    db.commit()
-    db.refresh(alert)
+    await db.commit()
+    await db.refresh(alert)
     return alert
 
 
-def remove_contract_alert(db: Session, keyword: str, chat_id: int) -> bool:
-    alert = (
-        db.query(ContractAlert)
-        .filter(ContractAlert.keyword == keyword)
-        .filter(ContractAlert.chat_ids.contains([chat_id]))
-        .first()
+async def remove_contract_alert(db: AsyncSession, keyword: str, chat_id: int) -> bool:
+    result = await db.execute(
+        select(ContractAlert)
+        .where(ContractAlert.keyword == keyword)
+        .where(ContractAlert.chat_ids.contains([chat_id]))
     )
+    alert = result.scalars().first()
     if alert:
         alert.chat_ids.remove(chat_id)
         flag_modified(alert, "chat_ids")
-        db.commit()
-        db.refresh(alert)
+        await db.commit()
+        await db.refresh(alert)
         return True
     return False
@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.enums import NetworkID
+from app.models import Contract, ContractCodeUnits
+
+
+async def get_contract_code_units(
+    db: AsyncSession, address: str, network_id: Optional[NetworkID] = None
+) -> Optional[Tuple[str, str, Optional[Dict[str, str]]]]:
+    """Name, compiler version and parsed code of a contract in one lookup"""
+    stmt = (
+        select(Contract.name, Contract.version, ContractCodeUnits.code)
+        .outerjoin(
+            ContractCodeUnits, ContractCodeUnits.source_hash == Contract.source_hash
+        )
+        .where(Contract.address == address.lower())
+        .order_by(Contract.timestamp.asc())
+    )
+    if network_id is not None:
+        stmt = stmt.where(Contract.network_id == network_id)
+    result = await db.execute(stmt)
+    return result.first()
+
+
+async def get_code_units_by_hashes(
+    db: AsyncSession, source_hashes: List[str]
+) -> Dict[str, Dict[str, str]]:
+    if len(source_hashes) == 0:
+        return {}
+    result = await db.execute(
+        select(ContractCodeUnits).where(
+            ContractCodeUnits.source_hash.in_(source_hashes)
+        )
+    )
+    return {row.source_hash: row.code for row in result.scalars()}
+
+
+async def save_contract_code_units(
+    db: AsyncSession, hash_to_code: Dict[str, Dict[str, str]]
+):
+    if len(hash_to_code) == 0:
+        return
+
+    stmt = insert(ContractCodeUnits).values(
+        [
+            dict(source_hash=source_hash, code=code)
+            for source_hash, code in hash_to_code.items()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ContractCodeUnits.source_hash],
+        set_={"code": stmt.excluded.code},
+    )
+    await db.execute(stmt)
+    await db.commit()
@@ -0,0 +1,44 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.diff import UnifiedDiff
+from app.models import ContractDiff
+
+
+async def get_contract_diff(
+    db: AsyncSession, source_hash: str, name: str, base_name: str, base_hash: str
+) -> Optional[ContractDiff]:
+    result = await db.execute(
+        select(ContractDiff).where(
+            ContractDiff.source_hash == source_hash,
+            ContractDiff.name == name,
+            ContractDiff.base_name == base_name,
+            ContractDiff.base_hash == base_hash,
+        )
+    )
+    return result.scalars().first()
+
+
+async def save_contract_diff(
+    db: AsyncSession,
+    source_hash: str,
+    name: str,
+    base_name: str,
+    base_hash: str,
+    diff: UnifiedDiff,
+):
+    stmt = insert(ContractDiff).values(
+        source_hash=source_hash,
+        name=name,
+        base_name=base_name,
+        base_hash=base_hash,
+        diff=diff.diff,
+        additions=diff.additions,
+        deletions=diff.deletions,
+    )
+    # Concurrent requests compute the same diff, so either copy is fine
+    await db.execute(stmt.on_conflict_do_nothing())
+    await db.commit()
@@ -0,0 +1,61 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import ContractSource
+from app.search import SearchDocument, search_vector
+
+
+async def get_unindexed_sources(
+    db: AsyncSession,
+    limit: int,
+    source_hashes: Optional[List[str]] = None,
+    after_hash: Optional[str] = None,
+):
+    """Rows (hash, abi, source_code) of sources missing a search vector, in hash
+    order. With after_hash, every source past it instead, for a full reindex."""
+    stmt = select(
+        ContractSource.hash, ContractSource.abi, ContractSource.source_code
+    ).order_by(ContractSource.hash)
+    if after_hash is not None:
+        stmt = stmt.where(ContractSource.hash > after_hash)
+    else:
+        stmt = stmt.where(ContractSource.search_vector.is_(None))
+    if source_hashes is not None:
+        stmt = stmt.where(ContractSource.hash.in_(source_hashes))
+    result = await db.execute(stmt.limit(limit))
+    return result.all()
+
+
+async def save_search_documents(
+    db: AsyncSession, hash_to_document: Dict[str, SearchDocument]
+):
+    if len(hash_to_document) == 0:
+        return
+
+    table = ContractSource.__table__
+    stmt = (
+        update(table)
+        .where(table.c.hash == bindparam("source_hash"))
+        .values(
+            search_vector=search_vector(
+                bindparam("source_name"),
+                bindparam("source_abi_identifiers"),
+                bindparam("source_identifiers"),
+            )
+        )
+    )
+    await db.execute(
+        stmt,
+        [
+            dict(
+                source_hash=source_hash,
+                source_name=document.name,
+                source_abi_identifiers=document.abi_identifiers,
+                source_identifiers=document.source_identifiers,
+            )
+            for source_hash, document in hash_to_document.items()
+        ],
+    )
+    await db.commit()
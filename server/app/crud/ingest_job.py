@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.enums import IngestStage, JobStatus, NetworkID
+from app.models import IngestJob
+from app.ratelimit import backoff_delay
+
+# Marks jobs of a historical backfill, which are loaded without alerts
+BACKFILL_PAYLOAD = {"backfill": True}
+
+
+async def enqueue_ingest_jobs(
+    db: AsyncSession,
+    stage: IngestStage,
+    network_id: NetworkID,
+    address_to_payload: Dict[str, dict],
+) -> int:
+    """Add jobs in the given order, skipping addresses already queued for the
+    stage on the network.
+
+    Jobs are stamped in list order, so created_at follows discovery order.
+    """
+    if len(address_to_payload) == 0:
+        return 0
+
+    stmt = (
+        insert(IngestJob)
+        .values(
+            [
+                dict(
+                    stage=stage,
+                    address=address.lower(),
+                    network_id=network_id,
+                    payload=payload,
+                    status=JobStatus.pending,
+                    attempts=0,
+                    created_at=func.now() + timedelta(microseconds=i),
+                )
+                for i, (address, payload) in enumerate(address_to_payload.items())
+            ]
+        )
+        .on_conflict_do_nothing(
+            index_elements=[IngestJob.stage, IngestJob.network_id, IngestJob.address]
+        )
+        .returning(IngestJob.job_id)
+    )
+    result = await db.execute(stmt)
+    enqueued = len(result.all())
+    await db.commit()
+    return enqueued
+
+
+async def claim_ingest_jobs(
+    db: AsyncSession,
+    stage: IngestStage,
+    limit: int,
+    lease_sec: float,
+    backfill_only: bool = False,
+):
+    """Lease up to `limit` runnable jobs, oldest first, or only those of a
+    historical backfill.
+
+    Jobs still running past their lease belonged to a worker that died, so
+    they are claimable again. SKIP LOCKED lets concurrent workers claim
+    disjoint batches without waiting on each other.
+    """
+    lease_expired = IngestJob.locked_at < func.now() - timedelta(seconds=lease_sec)
+    claimable = (
+        select(IngestJob.job_id)
+        .where(
+            IngestJob.stage == stage,
+            or_(
+                and_(
+                    IngestJob.status == JobStatus.pending,
+                    IngestJob.run_after <= func.now(),
+                ),
+                and_(IngestJob.status == JobStatus.running, lease_expired),
+            ),
+        )
+        .order_by(IngestJob.job_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if backfill_only:
+        claimable = claimable.where(IngestJob.payload.contains(BACKFILL_PAYLOAD))
+    stmt = (
+        update(IngestJob)
+        .where(IngestJob.job_id.in_(claimable.scalar_subquery()))
+        .values(
+            status=JobStatus.running,
+            locked_at=func.now(),
+            attempts=IngestJob.attempts + 1,
+        )
+        .returning(
+            IngestJob.job_id,
+            IngestJob.address,
+            IngestJob.network_id,
+            IngestJob.payload,
+            IngestJob.attempts,
+            IngestJob.created_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    jobs = sorted(result.all(), key=lambda job: job.job_id)
+    await db.commit()
+    return jobs
+
+
+async def complete_ingest_jobs(db: AsyncSession, job_ids: List[int]):
+    if len(job_ids) == 0:
+        return
+    await db.execute(
+        update(IngestJob)
+        .where(IngestJob.job_id.in_(job_ids))
+        .values(status=JobStatus.done, locked_at=None, last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def fail_ingest_jobs(
+    db: AsyncSession,
+    failures: List[Tuple[Any, str]],
+    max_attempts: int,
+    retry_base_sec: float,
+    retry_max_sec: float,
+) -> int:
+    """Schedule claimed jobs for a retry with backoff, or dead-letter them once
+    they are out of attempts. Takes (job, error) pairs and returns the number
+    dead-lettered."""
+    if len(failures) == 0:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    params = []
+    num_dead = 0
+    for job, error in failures:
+        is_dead = job.attempts >= max_attempts
+        num_dead += is_dead
+        delay = backoff_delay(job.attempts, retry_base_sec, retry_max_sec)
+        params.append(
+            dict(
+                job_job_id=job.job_id,
+                job_status=JobStatus.dead if is_dead else JobStatus.pending,
+                job_run_after=now + timedelta(seconds=delay),
+                job_last_error=error[:2000],
+            )
+        )
+
+    table = IngestJob.__table__
+    stmt = (
+        update(table)
+        .where(table.c.job_id == bindparam("job_job_id"))
+        .values(
+            status=bindparam("job_status"),
+            run_after=bindparam("job_run_after"),
+            locked_at=None,
+            last_error=bindparam("job_last_error"),
+        )
+    )
+    await db.execute(stmt, params)
+    await db.commit()
+    return num_dead
+
+
+async def requeue_dead_ingest_jobs(
+    db: AsyncSession, stage: Optional[IngestStage] = None
+) -> int:
+    stmt = (
+        update(IngestJob)
+        .where(IngestJob.status == JobStatus.dead)
+        .values(status=JobStatus.pending, attempts=0, run_after=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    if stage is not None:
+        stmt = stmt.where(IngestJob.stage == stage)
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount
+
+
+async def count_backfill_ingest_jobs(
+    db: AsyncSession,
+) -> Dict[Tuple[IngestStage, JobStatus], int]:
+    result = await db.execute(
+        select(IngestJob.stage, IngestJob.status, func.count())
+        .where(IngestJob.payload.contains(BACKFILL_PAYLOAD))
+        .group_by(IngestJob.stage, IngestJob.status)
+    )
+    return {(stage, status): count for stage, status, count in result.all()}
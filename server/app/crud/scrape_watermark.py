@@ -0,0 +1,43 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.enums import NetworkID
+from app.models import ScrapeWatermark
+
+
+async def get_scrape_watermark(
+    db: AsyncSession, network_id: NetworkID
+) -> Optional[ScrapeWatermark]:
+    result = await db.execute(
+        select(ScrapeWatermark).where(ScrapeWatermark.network_id == network_id)
+    )
+    return result.scalars().first()
+
+
+async def set_scrape_watermark(
+    db: AsyncSession,
+    network_id: NetworkID,
+    last_address: str,
+    last_verified_date: datetime.date,
+    full_scrape: bool = False,
+):
+    values = dict(
+        network_id=network_id,
+        last_address=last_address.lower(),
+        last_verified_date=last_verified_date,
+        updated_at=func.now(),
+    )
+    if full_scrape:
+        values["last_full_scrape"] = func.now()
+
+    stmt = insert(ScrapeWatermark).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ScrapeWatermark.network_id],
+        set_={k: stmt.excluded[k] for k in values if k != "network_id"},
+    )
+    await db.execute(stmt)
+    await db.commit()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.settings import settings
@@ -7,12 +7,25 @@ DB_URL = (
     f"postgresql://{settings.postgres_user}:{settings.postgres_pw}"
     f"@postgres:{settings.postgres_port}/{settings.postgres_db}"
 )
-engine = create_engine(DB_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ASYNC_DB_URL = DB_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
 
-def get_db():
-    db = SessionLocal()
-    try:
+engine = create_async_engine(
+    ASYNC_DB_URL,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout_sec,
+    pool_recycle=settings.db_pool_recycle_sec,
+    pool_pre_ping=True,
+    connect_args={
+        "server_settings": {"statement_timeout": str(settings.db_statement_timeout_ms)}
+    },
+)
+# Objects stay usable after commit since async sessions can't lazy load
+SessionLocal = sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
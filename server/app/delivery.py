@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import aiohttp
+
+from app.metrics import counter, gauge, histogram
+from app.ratelimit import TokenBucket, backoff_delay
+from app.settings import settings
+from app.web import get_session
+
+TELEGRAM_SEND_MESSAGE_URL = "https://api.telegram.org/bot{token}/sendMessage"
+MAX_MESSAGE_LENGTH = 4096
+MAX_SEND_ATTEMPTS = 5
+
+messages_sent = counter("telegram_messages_sent")
+messages_failed = counter("telegram_messages_failed")
+messages_throttled = counter("telegram_messages_throttled")
+delivery_latency = histogram("telegram_delivery_latency_sec")
+
+
+class OutboundMessage(NamedTuple):
+    chat_id: int
+    text: str
+    parse_mode: Optional[str]
+    enqueued_at: float
+
+
+class TelegramDeliveryQueue:
+    """Outbound Telegram messages sent concurrently by a pool of workers.
+
+    Messages are queued per chat and a chat is only handled by one worker at a
+    time, so each chat receives its messages in order. Messages waiting for the
+    same chat are coalesced into as few sends as fit under Telegram's length cap.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        messages_per_sec: float,
+        chat_messages_per_sec: float,
+        group_messages_per_min: float,
+    ):
+        self.num_workers = num_workers
+        self.chat_messages_per_sec = chat_messages_per_sec
+        self.group_messages_per_min = group_messages_per_min
+        self._global_limiter = TokenBucket(messages_per_sec)
+        self._chat_limiters: Dict[int, TokenBucket] = {}
+        self._pending: Dict[int, List[OutboundMessage]] = {}
+        self._in_flight: Set[int] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return sum(len(messages) for messages in self._pending.values())
+
+    def start(self):
+        if len(self._workers) > 0:
+            return
+        self._loop = asyncio.get_event_loop()
+        self._ready = asyncio.Queue()
+        self._workers = [
+            self._loop.create_task(self._worker()) for _ in range(self.num_workers)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def enqueue(self, chat_id: int, text: str, parse_mode: Optional[str] = "Markdown"):
+        """Queue a message for delivery, safe to call from any thread"""
+        if self._loop is None:
+            raise RuntimeError("Telegram delivery queue has not been started")
+
+        now = time.monotonic()
+        messages = [
+            OutboundMessage(chat_id, chunk, parse_mode, now)
+            for chunk in split_message(text)
+        ]
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._put(messages)
+        else:
+            self._loop.call_soon_threadsafe(self._put, messages)
+
+    def _put(self, messages: List[OutboundMessage]):
+        for message in messages:
+            pending = self._pending.setdefault(message.chat_id, [])
+            if len(pending) == 0 and message.chat_id not in self._in_flight:
+                self._ready.put_nowait(message.chat_id)
+            pending.append(message)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            self._in_flight.add(chat_id)
+            try:
+                batch = self._take_batch(chat_id)
+                if len(batch) > 0:
+                    await self._send(batch)
+            except Exception as e:
+                logging.error(e)
+            finally:
+                self._in_flight.discard(chat_id)
+                if self._pending.get(chat_id):
+                    self._ready.put_nowait(chat_id)
+                else:
+                    self._pending.pop(chat_id, None)
+
+    def _take_batch(self, chat_id: int) -> List[OutboundMessage]:
+        # Coalesce leading messages that share a parse mode and fit in one send
+        pending = self._pending.get(chat_id, [])
+        batch: List[OutboundMessage] = []
+        length = 0
+        while len(pending) > 0:
+            message = pending[0]
+            new_length = length + len(message.text) + (1 if batch else 0)
+            if batch and (
+                new_length > MAX_MESSAGE_LENGTH
+                or message.parse_mode != batch[0].parse_mode
+            ):
+                break
+            batch.append(pending.pop(0))
+            length = new_length
+        return batch
+
+    async def _send(self, batch: List[OutboundMessage]):
+        chat_id = batch[0].chat_id
+        data = {
+            "chat_id": chat_id,
+            "text": "\n".join(message.text for message in batch),
+            "disable_web_page_preview": True,
+        }
+        if batch[0].parse_mode:
+            data["parse_mode"] = batch[0].parse_mode
+        url = TELEGRAM_SEND_MESSAGE_URL.format(token=settings.telegram_bot_token)
+
+        body = None
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            chat_limiter = self._get_chat_limiter(chat_id)
+            await chat_limiter.acquire()
+            await self._global_limiter.acquire()
+            try:
+                async with get_session().post(url, json=data) as res:
+                    body = await res.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"Failed to reach Telegram for {chat_id}: {e}")
+                await asyncio.sleep(backoff_delay(attempt, 1, 30))
+                continue
+
+            if body.get("ok"):
+                messages_sent.inc(len(batch))
+                now = time.monotonic()
+                for message in batch:
+                    delivery_latency.observe(now - message.enqueued_at)
+                return
+            if res.status == 429:
+                # Telegram throttles the bot as a whole, so every chat backs off.
+                # The next acquire sleeps off the penalty.
+                messages_throttled.inc()
+                retry_after = body.get("parameters", {}).get("retry_after", 1)
+                chat_limiter.penalize(retry_after)
+                self._global_limiter.penalize(retry_after)
+                continue
+            if res.status >= 500:
+                await asyncio.sleep(backoff_delay(attempt, 1, 30))
+                continue
+            break  # Other client errors won't succeed on retry
+
+        messages_failed.inc(len(batch))
+        logging.error(f"Failed to send message to {chat_id}: {body}")
+
+    def _get_chat_limiter(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self._chat_limiters:
+            # Group chats have negative ids and a stricter per-minute limit
+            if chat_id < 0:
+                rate = self.group_messages_per_min / 60
+            else:
+                rate = self.chat_messages_per_sec
+            self._chat_limiters[chat_id] = TokenBucket(rate, capacity=1)
+        return self._chat_limiters[chat_id]
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split on line boundaries so every chunk fits in a single Telegram message"""
+    chunks = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+delivery_queue = TelegramDeliveryQueue(
+    settings.telegram_delivery_workers,
+    settings.telegram_messages_per_sec,
+    settings.telegram_chat_messages_per_sec,
+    settings.telegram_group_messages_per_min,
+)
+gauge("telegram_queue_depth", lambda: delivery_queue.depth)
@@ -1,103 +1,252 @@
 import difflib
+import hashlib
 import json
 import os
-import re
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from app.models import Contract
+from app.settings import settings
+from app.similarity import (
+    Fingerprint,
+    count_line_diffs,
+    fingerprint,
+    top_candidates,
+)
+from app.solidity import find_units
 
 BASE_CONTRACTS_PATH = "app/base_contracts/"
 
 
-def get_closest_base_contract(new_contracts: List[Contract]) -> List[str]:
-    base_contract_name_to_code = {}
-    for name in os.listdir(BASE_CONTRACTS_PATH):
-        base_contract_dir = os.path.join(BASE_CONTRACTS_PATH, name)
-        files = os.listdir(base_contract_dir)
+class BaseContract(NamedTuple):
+    name: str
+    code: Dict[str, str]
+    compiler_version: str
+    content_hash: str
+    fingerprint: Fingerprint
+
+
+class UnifiedDiff(NamedTuple):
+    diff: str
+    additions: int
+    deletions: int
+
+
+class BaseContractRegistry:
+    """Parsed base contracts kept in memory.
+
+    Entries are re-checked against file mtimes and sizes on access and only
+    re-parsed when the hash of their source files changes.
+    """
+
+    def __init__(self, path: str = BASE_CONTRACTS_PATH):
+        self.path = path
+        self._contracts: Dict[str, BaseContract] = {}
+        self._signatures: Dict[str, Tuple] = {}
+
+    def load(self):
+        self._contracts = {}
+        self._signatures = {}
+        self.refresh()
+
+    def refresh(self):
+        names = sorted(
+            name
+            for name in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, name))
+        )
+        for name in list(self._contracts):
+            if name not in names:
+                del self._contracts[name]
+                del self._signatures[name]
+
+        for name in names:
+            base_contract_dir = os.path.join(self.path, name)
+            signature = _dir_signature(base_contract_dir)
+            if self._signatures.get(name) == signature:
+                continue
+            self._signatures[name] = signature
+            self._load_contract(name, base_contract_dir)
+
+    def get(self, name: str) -> Optional[BaseContract]:
+        self.refresh()
+        return self._contracts.get(name)
+
+    def all(self) -> List[BaseContract]:
+        self.refresh()
+        return list(self._contracts.values())
+
+    @property
+    def version(self) -> str:
+        """Changes whenever a base contract is added, removed or edited"""
+        self.refresh()
+        content = "\n".join(
+            f"{name}:{self._contracts[name].content_hash}"
+            for name in sorted(self._contracts)
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+    def _load_contract(self, name: str, base_contract_dir: str):
         file_strs = []
-        for f in files:
+        for f in sorted(os.listdir(base_contract_dir)):
             f_path = os.path.join(base_contract_dir, f)
-            if os.path.isfile(f_path):
+            if os.path.isfile(f_path) and f.endswith(".sol"):
                 file_strs.append(Path(f_path).read_text())
-        code = contracts_to_code("\n".join(file_strs))[name]
-        base_contract_name_to_code[name] = code
+        source_str = "\n".join(file_strs)
+
+        version_path = os.path.join(base_contract_dir, "compiler_version.txt")
+        compiler_version = (
+            Path(version_path).read_text() if os.path.isfile(version_path) else ""
+        )
+
+        content_hash = hashlib.sha256(
+            (source_str + compiler_version).encode("utf-8")
+        ).hexdigest()
+        existing = self._contracts.get(name)
+        if existing and existing.content_hash == content_hash:
+            return
+
+        code = contracts_to_code(source_str)
+        self._contracts[name] = BaseContract(
+            name=name,
+            code=code,
+            compiler_version=compiler_version,
+            content_hash=content_hash,
+            fingerprint=fingerprint(code.get(name) or ""),
+        )
+
+
+base_contract_registry = BaseContractRegistry()
+
+
+def get_closest_base_contract(new_contracts: List[Contract]) -> List[str]:
+    base_contracts = get_diffable_base_contracts()
 
     closest_contracts: List[str] = []
     for contract in new_contracts:
-        min_diffs = float("inf")
-        closest_contract_name = os.listdir(BASE_CONTRACTS_PATH)[0]
-
-        # Find closest base contract
-        new_code = parse_contract_code(contract).get(contract.name, None)
+        new_code, new_fingerprint = prepare_contract(
+            contract.name, contract.source_code
+        )
         if not new_code:
-            closest_contracts.append(closest_contract_name)
+            closest_contracts.append(base_contracts[0].name)
             continue
 
-        for base_contract_name, base_contract in base_contract_name_to_code.items():
-            num_diffs = _get_num_diffs(base_contract, new_code)
-            if num_diffs < min_diffs:
-                min_diffs = num_diffs
-                closest_contract_name = base_contract_name
-        closest_contracts.append(closest_contract_name)
+        candidates = get_candidate_base_contracts(base_contracts, new_fingerprint)
+        num_diffs = [
+            count_line_diffs(base_contract.code[base_contract.name], new_code)
+            for base_contract in candidates
+        ]
+        closest_contracts.append(pick_closest_base_contract(candidates, num_diffs))
 
     return closest_contracts
 
 
+def get_diffable_base_contracts() -> List[BaseContract]:
+    return [
+        base_contract
+        for base_contract in base_contract_registry.all()
+        if base_contract.code.get(base_contract.name)
+    ]
+
+
+def get_candidate_base_contracts(
+    base_contracts: List[BaseContract], new_fingerprint: Fingerprint
+) -> List[BaseContract]:
+    # Only run the exact diff against the most similar candidates
+    candidates = top_candidates(
+        new_fingerprint,
+        [base_contract.fingerprint for base_contract in base_contracts],
+        settings.diff_candidates,
+    )
+    return [base_contracts[i] for i in candidates]
+
+
+def pick_closest_base_contract(
+    candidates: List[BaseContract], num_diffs: List[float]
+) -> str:
+    # Fewest diffs wins, ties go to the earlier base contract
+    min_diffs = float("inf")
+    closest_contract_name = candidates[0].name
+    for base_contract, diffs in zip(candidates, num_diffs):
+        if diffs < min_diffs:
+            min_diffs = diffs
+            closest_contract_name = base_contract.name
+    return closest_contract_name
+
+
+def prepare_contract(
+    name: str, source_code: str
+) -> Tuple[Optional[str], Optional[Fingerprint]]:
+    """Main contract code and its fingerprint, or None if it can't be parsed"""
+    new_code = parse_source_code(source_code).get(name, None)
+    if not new_code:
+        return None, None
+    return new_code, fingerprint(new_code)
+
+
+def make_unified_diff(
+    base_code: str, new_code: str, base_label: str, new_label: str
+) -> UnifiedDiff:
+    """Unified diff with 3 lines of context, plus added and removed line counts"""
+    lines = list(
+        difflib.unified_diff(
+            base_code.splitlines(),
+            new_code.splitlines(),
+            fromfile=base_label,
+            tofile=new_label,
+            lineterm="",
+        )
+    )
+    # Skip the ---/+++ file headers when counting
+    additions = sum(1 for line in lines[2:] if line.startswith("+"))
+    deletions = sum(1 for line in lines[2:] if line.startswith("-"))
+    return UnifiedDiff("\n".join(lines), additions, deletions)
+
+
 def contracts_to_code(source_str: str) -> Dict[str, str]:
     # Match any library, interface, or contract names
-    file_regex = r"(library|interface|contract)\s+(\S+)\s*.*\s*\{"
-    matches = re.findall(file_regex, source_str)
     code = {}
-    for match in matches:
-        filetype, name = match
-        code[name] = _get_code_from_file(source_str, filetype, name)
+    for name, (_, start, end) in find_units(source_str).items():
+        code[name] = _clean_code(source_str[start:end])
     return code
 
 
 def parse_contract_code(contract: Contract) -> Dict[str, str]:
-    source_code_json = json.loads(contract.source_code)[0]["SourceCode"]
-    if source_code_json[0] == "{" and source_code_json == "}":
-        sources = json.loads(source_code_json[1:-1])
-        source_str = ""
-        for source in sources["sources"]:
-            source_str += source["content"]
-    else:
-        source_str = source_code_json
-    return contracts_to_code(source_str)
-
-
-def _get_code_from_file(source_str: str, type: str, name: str):
-    contract_regex = rf"{type}\s+{name}\s*.*\s*\{{"
-    res = re.search(contract_regex, source_str)
-    if not res:
-        return None
-
-    start_idx = res.start()
-    # Position of starting brace + 1
-    close_idx = res.end() + 1
-    opened_braces = 1
-
-    # Find closing bracket for contract
-    while opened_braces > 0 and close_idx < len(source_str):
-        if source_str[close_idx] == "{":
-            opened_braces += 1
-        elif source_str[close_idx] == "}":
-            opened_braces -= 1
-        close_idx += 1
-
-    res = source_str[start_idx : min(close_idx + 1, len(source_str))]
-    return res.strip("\\").replace("\\\\n", "\n").replace('\\\\"', '"')
-
-
-def _get_num_diffs(a, b):
-    differ = difflib.Differ()
-    diffs = differ.compare(a, b)
-
-    num_diffs = 0
-    for line in diffs:
-        diff_code = line[:2]
-        line_contents = line[2:]
-        if diff_code in ["+ ", "- "] and line_contents.strip() != "":
-            num_diffs += 1
-    return num_diffs
+    return parse_source_code(contract.source_code)
+
+
+def parse_source_code(source_code: str) -> Dict[str, str]:
+    source_code_json = json.loads(source_code)[0]["SourceCode"]
+    return contracts_to_code(flatten_sources(source_code_json))
+
+
+def flatten_sources(source_code_json: str) -> str:
+    # Multi-file sources are JSON, either bare or wrapped in an extra pair of braces
+    if not (source_code_json.startswith("{") and source_code_json.endswith("}")):
+        return source_code_json
+    try:
+        if source_code_json.startswith("{{"):
+            sources = json.loads(source_code_json[1:-1])
+        else:
+            sources = json.loads(source_code_json)
+    except ValueError:
+        return source_code_json
+
+    sources = sources.get("sources", sources)
+    return "\n".join(
+        source["content"]
+        for source in sources.values()
+        if isinstance(source, dict) and "content" in source
+    )
+
+
+def _clean_code(code: str) -> str:
+    return code.strip("\\").replace("\\\\n", "\n").replace('\\\\"', '"')
+
+
+def _dir_signature(path: str) -> Tuple:
+    entries = []
+    for f in sorted(os.listdir(path)):
+        stat = os.stat(os.path.join(path, f))
+        entries.append((f, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
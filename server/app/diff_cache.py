@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+
+from app.diff import UnifiedDiff
+from app.metrics import counter, gauge
+from app.settings import settings
+
+V = TypeVar("V")
+
+contract_diff_cache_hits = counter("contract_diff_cache_hits")
+contract_diff_db_hits = counter("contract_diff_db_hits")
+contract_diffs_computed = counter("contract_diffs_computed")
+
+
+class LRUCache(Generic[V]):
+    """Bounded in-memory cache that evicts the least recently used entry"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: Hashable, value: V):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+# Keyed by (source hash, contract name, base name, base content hash)
+contract_diff_cache: LRUCache[UnifiedDiff] = LRUCache(settings.diff_cache_size)
+gauge("contract_diff_cache_size", lambda: len(contract_diff_cache))
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from app.diff import (
+    BaseContract,
+    get_candidate_base_contracts,
+    get_diffable_base_contracts,
+    parse_source_code,
+    pick_closest_base_contract,
+)
+from app.metrics import counter
+from app.settings import settings
+from app.similarity import count_line_diffs, fingerprint
+
+diff_tasks = counter("diff_tasks")
+diff_timeouts = counter("diff_timeouts")
+diff_failures = counter("diff_failures")
+
+
+class BaseMatch(NamedTuple):
+    # Both None if the contract couldn't be matched, so it's retried later
+    name: Optional[str]
+    num_diffs: Optional[int]
+
+
+FAILED_MATCH = BaseMatch(None, None)
+
+
+class DiffService:
+    """Runs contract diffing in a process pool so it never blocks the event loop.
+
+    Work is split into one task per (contract, base contract) pair. At most
+    max_workers tasks are submitted at once, so the timeout only counts time
+    spent running. A task that exceeds it is scored as infinitely far away, and
+    since a running task can't be cancelled its pool is replaced so the stuck
+    worker can't hold up everything queued behind it.
+    """
+
+    def __init__(self, max_workers: int, timeout_sec: float):
+        self.max_workers = max_workers
+        self.timeout_sec = timeout_sec
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Created on first use, so it belongs to the running event loop
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def parse_source_codes(
+        self, source_codes: List[str]
+    ) -> List[Optional[Dict[str, str]]]:
+        """Code units of each source, or None for sources that failed to parse"""
+        results = await asyncio.gather(
+            *[self.run(parse_source_code, source_code) for source_code in source_codes],
+            return_exceptions=True,
+        )
+        return [None if isinstance(result, Exception) else result for result in results]
+
+    async def get_base_matches(self, new_codes: List[Optional[str]]) -> List[BaseMatch]:
+        base_contracts = get_diffable_base_contracts()
+        return list(
+            await asyncio.gather(
+                *[self._get_closest(base_contracts, code) for code in new_codes]
+            )
+        )
+
+    async def _get_closest(
+        self, base_contracts: List[BaseContract], new_code: Optional[str]
+    ) -> BaseMatch:
+        if not new_code:
+            return FAILED_MATCH
+        try:
+            new_fingerprint = await self.run(fingerprint, new_code)
+        except Exception as e:
+            logging.error(f"Failed to fingerprint contract: {e}")
+            return FAILED_MATCH
+
+        candidates = get_candidate_base_contracts(base_contracts, new_fingerprint)
+        results = await asyncio.gather(
+            *[
+                self.run(count_line_diffs, base.code[base.name], new_code)
+                for base in candidates
+            ],
+            return_exceptions=True,
+        )
+        num_diffs = [
+            float("inf") if isinstance(result, Exception) else result
+            for result in results
+        ]
+        min_diffs = min(num_diffs)
+        if min_diffs == float("inf"):
+            return FAILED_MATCH
+        return BaseMatch(pick_closest_base_contract(candidates, num_diffs), min_diffs)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run a picklable CPU-bound function in the pool"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        async with self._slots:
+            self.start()
+            executor = self._executor
+            diff_tasks.inc()
+            loop = asyncio.get_event_loop()
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(executor, fn, *args), self.timeout_sec
+                )
+            except asyncio.TimeoutError:
+                diff_timeouts.inc()
+                self._replace_pool(executor)
+                raise
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge contract), start a fresh pool
+                diff_failures.inc()
+                self._replace_pool(executor)
+                raise
+
+    def _replace_pool(self, executor: ProcessPoolExecutor):
+        # Tasks that were running alongside fail with BrokenProcessPool and
+        # land here too, after the pool was already replaced
+        if self._executor is not executor:
+            return
+        self._executor = None
+        # Running tasks can't be cancelled, so stop their workers outright
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+
+diff_service = DiffService(settings.diff_workers, settings.diff_timeout_sec)
@@ -5,3 +5,15 @@ class NetworkID(enum.Enum):
     mainnet = 1
     fantom = 250
     arbitrum = 42161
+
+
+class IngestStage(enum.Enum):
+    fetch = "fetch"
+    process = "process"
+
+
+class JobStatus(enum.Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    dead = "dead"
@@ -0,0 +1,85 @@
+from typing import Dict, List
+
+from app.enums import NetworkID
+from app.metrics import counter
+from app.ratelimit import SharedTokenBucket
+from app.settings import settings
+
+
+class Explorer:
+    """An Etherscan-family block explorer, with its own API key and rate budget.
+
+    Each explorer has its own token bucket, so a throttled network never holds
+    up requests to the others. The bucket is shared by every process that
+    fetches, so they split the configured rate between them.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        network_id: NetworkID,
+        site_url: str,
+        api_url: str,
+        api_key: str,
+        requests_per_sec: float,
+    ):
+        self.name = name
+        self.network_id = network_id
+        self.site_url = site_url
+        self.api_url = api_url
+        self.api_key = api_key
+        self.limiter = SharedTokenBucket(name, requests_per_sec)
+        self.requests = counter(f"{name}_requests")
+        self.throttled = counter(f"{name}_throttled")
+        self.retried = counter(f"{name}_retried")
+
+    def contract_api_url(self, action: str, address: str) -> str:
+        return (
+            f"{self.api_url}?module=contract&action={action}"
+            f"&address={address}&apikey={self.api_key}"
+        )
+
+    def verified_contracts_url(self, page: int) -> str:
+        return f"{self.site_url}/contractsVerified/{page}"
+
+    def address_url(self, address: str) -> str:
+        return f"{self.site_url}/address/{address}"
+
+
+explorers: Dict[NetworkID, Explorer] = {
+    NetworkID.mainnet: Explorer(
+        "etherscan",
+        NetworkID.mainnet,
+        "https://etherscan.io",
+        "https://api.etherscan.io/api",
+        settings.etherscan_api_key,
+        settings.etherscan_requests_per_sec,
+    ),
+    NetworkID.fantom: Explorer(
+        "ftmscan",
+        NetworkID.fantom,
+        "https://ftmscan.com",
+        "https://api.ftmscan.com/api",
+        settings.ftmscan_api_key,
+        settings.ftmscan_requests_per_sec,
+    ),
+    NetworkID.arbitrum: Explorer(
+        "arbiscan",
+        NetworkID.arbitrum,
+        "https://arbiscan.io",
+        "https://api.arbiscan.io/api",
+        settings.arbiscan_api_key,
+        settings.arbiscan_requests_per_sec,
+    ),
+}
+
+
+def get_scrape_networks() -> List[NetworkID]:
+    names = [name.strip() for name in settings.scrape_networks.split(",")]
+    unknown = [name for name in names if name and name not in NetworkID.__members__]
+    if unknown:
+        raise ValueError(
+            f"Unknown SCRAPE_NETWORKS {unknown}, "
+            f"expected any of {list(NetworkID.__members__)}"
+        )
+    return [NetworkID[name] for name in names if name]
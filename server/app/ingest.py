@@ -0,0 +1,308 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, time, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import app.crud as crud
+from app.base_matches import update_base_matches
+from app.crud.ingest_job import BACKFILL_PAYLOAD
+from app.database import SessionLocal
+from app.diff import base_contract_registry
+from app.diff_service import diff_service
+from app.enums import IngestStage, NetworkID
+from app.metrics import counter
+from app.models import Contract
+from app.schemas import VerifiedContract
+from app.search import make_search_document
+from app.settings import settings
+from app.utils import fetch_contract_source, send_telegram_alerts
+
+ingest_jobs_done = counter("ingest_jobs_done")
+ingest_jobs_retried = counter("ingest_jobs_retried")
+ingest_jobs_dead = counter("ingest_jobs_dead")
+
+# Runs a batch of claimed jobs, returning errors for the jobs that failed
+StageHandler = Callable[[list], Awaitable[Dict[int, str]]]
+
+# Contracts imported by address have no known verification date, so they are
+# stamped before every other contract
+IMPORTED_TIMESTAMP = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class IngestWorker:
+    """Workers draining one stage of the ingest job queue.
+
+    Any number of processes can run workers for the same stage, since each
+    batch is claimed with SKIP LOCKED. Failed jobs are retried with backoff
+    and dead-lettered after settings.ingest_max_attempts.
+    """
+
+    def __init__(
+        self,
+        stage: IngestStage,
+        handler: StageHandler,
+        num_workers: int,
+        batch_size: int,
+        backfill_only: bool = False,
+    ):
+        self.stage = stage
+        self.handler = handler
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.backfill_only = backfill_only
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        if len(self._workers) > 0:
+            return
+        loop = asyncio.get_event_loop()
+        self._workers = [loop.create_task(self.run()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def run(self):
+        while True:
+            try:
+                num_jobs = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ingest {self.stage.value} worker failed: {e}")
+                num_jobs = 0
+            if num_jobs == 0:
+                await asyncio.sleep(settings.ingest_poll_sec)
+
+    async def run_once(self) -> int:
+        async with SessionLocal() as db:
+            jobs = await crud.claim_ingest_jobs(
+                db,
+                self.stage,
+                self.batch_size,
+                settings.ingest_lease_sec,
+                self.backfill_only,
+            )
+        if len(jobs) == 0:
+            return 0
+
+        try:
+            errors = await self.handler(jobs)
+        except Exception as e:
+            errors = {job.job_id: str(e) for job in jobs}
+
+        failures = [(job, errors[job.job_id]) for job in jobs if job.job_id in errors]
+        async with SessionLocal() as db:
+            await crud.complete_ingest_jobs(
+                db, [job.job_id for job in jobs if job.job_id not in errors]
+            )
+            num_dead = await crud.fail_ingest_jobs(
+                db,
+                failures,
+                settings.ingest_max_attempts,
+                settings.ingest_retry_base_sec,
+                settings.ingest_retry_max_sec,
+            )
+        ingest_jobs_done.inc(len(jobs) - len(failures))
+        ingest_jobs_retried.inc(len(failures) - num_dead)
+        ingest_jobs_dead.inc(num_dead)
+        for job, error in failures:
+            logging.error(
+                f"Ingest {self.stage.value} failed for {job.address}: {error}"
+            )
+        return len(jobs)
+
+
+async def fetch_contracts_stage(jobs: list) -> Dict[int, str]:
+    """Fetch source and ABI, store the contracts and queue them for processing"""
+    results = await asyncio.gather(
+        *[fetch_contract_source(job.address, job.network_id) for job in jobs],
+        return_exceptions=True,
+    )
+    errors = {}
+    contracts: List[VerifiedContract] = []
+    timestamps: List[datetime] = []
+    fetched_jobs = []
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            errors[job.job_id] = f"Failed to fetch source: {result}"
+            continue
+        abi, source_code = result
+        try:
+            contract = _to_verified_contract(job.payload, abi, source_code)
+        except Exception as e:
+            errors[job.job_id] = f"Failed to read contract metadata: {e}"
+            continue
+        contracts.append(contract)
+        timestamps.append(_contract_timestamp(job, contract, len(contracts)))
+        fetched_jobs.append(job)
+
+    async with SessionLocal() as db:
+        inserted = set(await crud.create_contracts(db, contracts, timestamps))
+        # Contracts that were already stored are processed already, unless an
+        # earlier attempt of this job stored them and failed before queueing
+        # them. The unique index keeps a contract from being processed twice.
+        network_to_payloads: Dict[NetworkID, Dict[str, dict]] = {}
+        for job in fetched_jobs:
+            if (job.network_id, job.address) in inserted or job.attempts > 1:
+                network_to_payloads.setdefault(job.network_id, {})[job.address] = (
+                    BACKFILL_PAYLOAD if job.payload.get("backfill") else {}
+                )
+        for network_id, address_to_payload in network_to_payloads.items():
+            await crud.enqueue_ingest_jobs(
+                db, IngestStage.process, network_id, address_to_payload
+            )
+    return errors
+
+
+async def process_contracts_stage(jobs: list) -> Dict[int, str]:
+    """Parse, diff against the base contracts and send alerts.
+
+    A source that fails to index or tokenize only fails the jobs of its
+    contracts, the rest of the batch goes on. Those jobs are retried before
+    their alerts are sent.
+    """
+    keys = [(job.network_id, job.address) for job in jobs]
+    async with SessionLocal() as db:
+        contracts = await crud.get_contracts_by_keys(db, keys)
+    await _store_code_units(contracts)
+    hash_to_error = await _store_search_documents(
+        list({c.source_hash for c in contracts})
+    )
+    await _store_base_matches(keys)
+    key_to_error = {
+        (c.network_id, c.address): (
+            f"Failed to index source: {hash_to_error[c.source_hash]}"
+        )
+        for c in contracts
+        if c.source_hash in hash_to_error
+    }
+    # Historical contracts are bulk-loaded, not news
+    alert_errors = await send_telegram_alerts(
+        [
+            key
+            for job, key in zip(jobs, keys)
+            if not job.payload.get("backfill") and key not in key_to_error
+        ]
+    )
+    for key, error in alert_errors.items():
+        key_to_error[key] = f"Failed to match alerts: {error}"
+    return {
+        job.job_id: key_to_error[key]
+        for job, key in zip(jobs, keys)
+        if key in key_to_error
+    }
+
+
+def _contract_timestamp(job, contract: VerifiedContract, i: int) -> datetime:
+    if job.payload.get("backfill"):
+        if "verified_date" not in job.payload:
+            return IMPORTED_TIMESTAMP + timedelta(microseconds=i)
+        # Historical contracts are stamped at their verification date, so they
+        # sort behind the ones the scraper is discovering now
+        return datetime.combine(
+            contract.verified_date, time(), tzinfo=timezone.utc
+        ) + timedelta(microseconds=i)
+    # Discovery queues contracts oldest first, and fetch batches can commit in
+    # any order, so stamp them in queue order
+    return job.created_at
+
+
+def _to_verified_contract(
+    payload: dict, abi: str, source_code: str
+) -> VerifiedContract:
+    if "name" not in payload:
+        # Imported by address alone, so take the metadata the explorer returns with
+        # the source. It doesn't expose the verification date, so that is left
+        # unknown and the row is stamped at IMPORTED_TIMESTAMP.
+        data = json.loads(source_code)[0]
+        if not data.get("ContractName"):
+            raise ValueError("contract is not verified")
+        compiler_version = data["CompilerVersion"]
+        if compiler_version.startswith("vyper"):
+            compiler, version = "Vyper", compiler_version.split(":")[-1]
+        else:
+            compiler, version = "Solidity", compiler_version.lstrip("v").split("+")[0]
+        license = data.get("LicenseType")
+        payload = dict(
+            payload,
+            name=data["ContractName"],
+            compiler=compiler,
+            version=version,
+            verified_date=None,
+            license=license if license not in ("", "None") else None,
+        )
+    return VerifiedContract(**payload, abi=abi, source_code=source_code)
+
+
+async def _store_code_units(contracts: List[Contract]):
+    # Parse once at ingest so readers never have to re-parse the source, and
+    # only once per distinct source since forks share their code units
+    hash_to_source = {c.source_hash: c.source_code for c in contracts}
+    async with SessionLocal() as db:
+        existing = await crud.get_code_units_by_hashes(db, list(hash_to_source))
+    source_hashes = [h for h in hash_to_source if h not in existing]
+    codes = await diff_service.parse_source_codes(
+        [hash_to_source[h] for h in source_hashes]
+    )
+    async with SessionLocal() as db:
+        await crud.save_contract_code_units(
+            db, {h: code for h, code in zip(source_hashes, codes) if code is not None},
+        )
+
+
+async def _store_search_documents(source_hashes: List[str]) -> Dict[str, str]:
+    # Like code units, only once per distinct source. Returns the error of each
+    # source that failed.
+    async with SessionLocal() as db:
+        sources = await crud.get_unindexed_sources(
+            db, len(source_hashes), source_hashes=source_hashes
+        )
+    documents = await asyncio.gather(
+        *[
+            diff_service.run(make_search_document, s.abi, s.source_code)
+            for s in sources
+        ],
+        return_exceptions=True,
+    )
+    async with SessionLocal() as db:
+        await crud.save_search_documents(
+            db,
+            {
+                s.hash: document
+                for s, document in zip(sources, documents)
+                if not isinstance(document, Exception)
+            },
+        )
+    return {
+        s.hash: str(document)
+        for s, document in zip(sources, documents)
+        if isinstance(document, Exception)
+    }
+
+
+async def _store_base_matches(keys: List[Tuple[NetworkID, str]]):
+    # Diff against the base contracts once at ingest, so alerts and listings
+    # read the stored result
+    corpus_version = base_contract_registry.version
+    async with SessionLocal() as db:
+        contracts = await crud.get_stale_base_matches(db, corpus_version, keys=keys)
+    await update_base_matches(contracts, corpus_version)
+
+
+fetch_worker = IngestWorker(
+    IngestStage.fetch,
+    fetch_contracts_stage,
+    settings.ingest_fetch_workers,
+    settings.ingest_batch_size,
+)
+
+process_worker = IngestWorker(
+    IngestStage.process,
+    process_contracts_stage,
+    settings.ingest_process_workers,
+    settings.ingest_batch_size,
+)
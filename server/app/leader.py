@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import func, select
+
+from app.database import engine
+
+# Arbitrary key shared by every process that may run the scraper
+SCRAPER_LOCK_ID = 4_170_923_611
+
+
+class LeaderElection:
+    """Runs a task in exactly one process, elected with a Postgres advisory lock.
+
+    The lock is held on a dedicated connection for as long as this process
+    leads. If the process dies its connection closes and Postgres releases the
+    lock, so a standby picks it up on its next attempt.
+    """
+
+    def __init__(
+        self, name: str, lock_id: int, fn: Callable[[], Awaitable], retry_sec: float
+    ):
+        self.name = name
+        self.lock_id = lock_id
+        self.fn = fn
+        self.retry_sec = retry_sec
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                await self._contend()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"{self.name} leader election failed: {e}")
+            await asyncio.sleep(self.retry_sec)
+
+    async def _contend(self):
+        async with engine.connect() as conn:
+            # Autocommit so the connection never sits idle in a transaction
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            result = await conn.execute(select(func.pg_try_advisory_lock(self.lock_id)))
+            if not result.scalar():
+                return
+
+            logging.info(f"Elected {self.name} leader")
+            self.is_leader = True
+            task = asyncio.get_event_loop().create_task(self.fn())
+            try:
+                await self._lead(conn, task)
+            finally:
+                self.is_leader = False
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                try:
+                    await conn.execute(select(func.pg_advisory_unlock(self.lock_id)))
+                except Exception:
+                    # Never hand a connection that may still hold the lock back
+                    # to the pool
+                    await conn.invalidate()
+
+    async def _lead(self, conn, task: asyncio.Task):
+        # Keep checking the lock's connection, since losing it loses the lock
+        while True:
+            done, _ = await asyncio.wait([task], timeout=self.retry_sec)
+            if task in done:
+                logging.error(f"{self.name} stopped: {task.exception()}")
+                return
+            await conn.execute(select(1))
@@ -1,23 +1,45 @@
 import asyncio
 import logging
 import os
-from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-
-from app import crud
-from app.bot import handle_commands, set_telegram_webhook_url
-from app.database import get_db
-from app.diff import contracts_to_code, parse_contract_code
-from app.schemas import ContractCode, VerifiedContract, VerifiedContractNoData
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, metrics
+from app.bot import set_telegram_webhook_url
+from app.command_queue import command_queue
+from app.database import SessionLocal, engine, get_db
+from app.delivery import delivery_queue
+from app.diff import (
+    BaseContract,
+    UnifiedDiff,
+    base_contract_registry,
+    make_unified_diff,
+)
+from app.diff_cache import (
+    contract_diff_cache,
+    contract_diff_cache_hits,
+    contract_diff_db_hits,
+    contract_diffs_computed,
+)
+from app.diff_service import diff_service
+from app.enums import NetworkID
+from app.explorers import get_scrape_networks
+from app.ingest import fetch_worker, process_worker
+from app.pagination import Cursor, decode_cursor, encode_cursor, next_cursor
+from app.schemas import (
+    ContractCode,
+    ContractDiff,
+    VerifiedContract,
+    VerifiedContractNoData,
+)
 from app.settings import settings
-from app.utils import scrape_verified_contracts
-from app.web import MAX_FETCH_LIMIT
+from app.utils import scraper_election
+from app.web import MAX_FETCH_LIMIT, close_session
 
 CLIENT_BUILD_PATH = "app/public"
 
@@ -31,6 +53,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.mount(
@@ -43,9 +66,18 @@ async def get_status():
     return
 
 
+@app.get("/api/metrics", status_code=200)
+async def get_metrics():
+    return metrics.snapshot()
+
+
 @app.get("/api/contract/{address}", status_code=200, response_model=VerifiedContract)
-async def get_contract(address: str, db: Session = Depends(get_db)):
-    contract = crud.get_contract(db, address=address)
+async def get_contract(
+    address: str, network_id: Optional[int] = None, db: AsyncSession = Depends(get_db)
+):
+    contract = await crud.get_contract(
+        db, address=address, network_id=_parse_network_id(network_id)
+    )
     if not contract:
         raise HTTPException(status_code=404, detail="Contract address not found")
     return contract
@@ -55,15 +87,44 @@ async def get_contract(address: str, db: Session = Depends(get_db)):
     "/api/contracts/", status_code=200, response_model=List[VerifiedContract],
 )
 async def get_contracts(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     most_recent: bool = True,
     include_contract_data: bool = False,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    closest_to: Optional[str] = None,
+    most_similar: bool = False,
+    network_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
 ):
-    contracts = crud.get_contracts(
-        db, skip=skip, limit=min(limit, MAX_FETCH_LIMIT), most_recent=most_recent,
+    if stream:
+        return _stream_contracts(
+            include_contract_data,
+            skip=skip,
+            limit=limit,
+            most_recent=most_recent,
+            cursor=_parse_cursor(cursor),
+            closest_to=closest_to,
+            most_similar=most_similar,
+            network_id=_parse_network_id(network_id),
+        )
+
+    limit = min(limit, MAX_FETCH_LIMIT)
+    contracts = await crud.get_contracts(
+        db,
+        skip=skip,
+        limit=limit,
+        most_recent=most_recent,
+        cursor=_parse_cursor(cursor),
+        include_contract_data=include_contract_data,
+        closest_to=closest_to,
+        most_similar=most_similar,
+        network_id=_parse_network_id(network_id),
     )
+    if not most_similar:
+        _set_next_cursor(response, contracts, limit)
     if include_contract_data:
         return [VerifiedContract.from_orm(c) for c in contracts]
     return [VerifiedContractNoData.from_orm(c) for c in contracts]
@@ -73,44 +134,108 @@ async def get_contracts(
     "/api/contracts/search", status_code=200, response_model=List[VerifiedContract]
 )
 async def get_contracts_search(
+    response: Response,
     query: str,
     skip: int = 0,
     limit: int = 100,
     most_recent: bool = True,
     include_contract_data: bool = False,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    closest_to: Optional[str] = None,
+    most_similar: bool = False,
+    network_id: Optional[int] = None,
+    order_by_rank: bool = False,
+    db: AsyncSession = Depends(get_db),
 ):
-    contracts = crud.search_contracts(
+    if stream:
+        return _stream_contracts(
+            include_contract_data,
+            query=query,
+            skip=skip,
+            limit=limit,
+            most_recent=most_recent,
+            cursor=_parse_cursor(cursor),
+            closest_to=closest_to,
+            most_similar=most_similar,
+            network_id=_parse_network_id(network_id),
+            order_by_rank=order_by_rank,
+        )
+
+    limit = min(limit, MAX_FETCH_LIMIT)
+    contracts = await crud.search_contracts(
         db,
         query,
         skip=skip,
-        limit=min(limit, MAX_FETCH_LIMIT),
+        limit=limit,
         most_recent=most_recent,
+        cursor=_parse_cursor(cursor),
+        include_contract_data=include_contract_data,
+        closest_to=closest_to,
+        most_similar=most_similar,
+        network_id=_parse_network_id(network_id),
+        order_by_rank=order_by_rank,
     )
+    if not (most_similar or order_by_rank):
+        _set_next_cursor(response, contracts, limit)
     if include_contract_data:
         return [VerifiedContract.from_orm(c) for c in contracts]
     return [VerifiedContractNoData.from_orm(c) for c in contracts]
 
 
+def _stream_contracts(include_contract_data: bool, **filters) -> StreamingResponse:
+    """Newline-delimited JSON, one contract per line, sent as rows are read"""
+    schema = VerifiedContract if include_contract_data else VerifiedContractNoData
+
+    async def lines():
+        # The request's session may be closed before the body finishes streaming
+        async with SessionLocal() as db:
+            async for contract in crud.stream_contracts(
+                db, include_contract_data=include_contract_data, **filters
+            ):
+                yield schema.from_orm(contract).json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _parse_network_id(network_id: Optional[int]) -> Optional[NetworkID]:
+    # Chain IDs, matching the network_id the contracts are returned with
+    if network_id is None:
+        return None
+    try:
+        return NetworkID(network_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Unknown network_id")
+
+
+def _set_next_cursor(response: Response, contracts: list, limit: int):
+    # The body stays a plain list for existing clients, so the cursor goes in a header
+    cursor = next_cursor(contracts, limit)
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(cursor)
+
+
 @app.get(
     "/api/base_contract_code/{name}", status_code=200, response_model=ContractCode,
 )
 async def get_base_contract_code(name: str):
-    filedir = f"app/base_contracts/{name}/"
-    if not os.path.exists(filedir):
+    base_contract = base_contract_registry.get(name)
+    if not base_contract:
         raise HTTPException(status_code=404, detail="Base contract not found")
 
-    files = os.listdir(filedir)
-    file_strs = []
-    for f in files:
-        f_path = os.path.join(filedir, f)
-        if os.path.isfile(f_path) and f.endswith(".sol"):
-            file_strs.append(Path(f_path).read_text())
-
-    code = contracts_to_code("\n".join(file_strs))
-    compiler_version = Path(os.path.join(filedir, "compiler_version.txt")).read_text()
     contract_code = ContractCode(
-        name=name, code=code, compiler_version=compiler_version
+        name=name,
+        code=base_contract.code,
+        compiler_version=base_contract.compiler_version,
     )
     return contract_code
 
@@ -119,22 +244,108 @@ async def get_base_contract_code(name: str):
     "/api/contract_code/{address}", status_code=200, response_model=ContractCode,
 )
 async def get_contract_code(
-    address: str, db: Session = Depends(get_db),
+    address: str, network_id: Optional[int] = None, db: AsyncSession = Depends(get_db),
 ):
-    contract = crud.get_contract(db, address=address)
-    if not contract:
+    network = _parse_network_id(network_id)
+    row = await crud.get_contract_code_units(db, address=address, network_id=network)
+    if not row:
         raise HTTPException(status_code=404, detail="Contract address not found")
 
-    code = parse_contract_code(contract)
+    name, version, code = row
+    if code is None:
+        code = await _parse_contract_code(db, address, network)
     if not code:
         raise HTTPException(status_code=404, detail="Could not parse base contract")
 
-    contract_code = ContractCode(
-        name=contract.name, code=code, compiler_version=contract.version
-    )
+    contract_code = ContractCode(name=name, code=code, compiler_version=version)
     return contract_code
 
 
+@app.get(
+    "/api/diff/{address}/{base_name}", status_code=200, response_model=ContractDiff,
+)
+async def get_contract_diff(
+    address: str,
+    base_name: str,
+    network_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    base_contract = base_contract_registry.get(base_name)
+    if not base_contract or not base_contract.code.get(base_name):
+        raise HTTPException(status_code=404, detail="Base contract not found")
+    network = _parse_network_id(network_id)
+    source_key = await crud.get_contract_source_key(
+        db, address=address, network_id=network
+    )
+    if not source_key:
+        raise HTTPException(status_code=404, detail="Contract address not found")
+
+    # Forks share a source, so one diff serves every address with that source
+    name, source_hash = source_key
+    key = (source_hash, name, base_name, base_contract.content_hash)
+    diff = contract_diff_cache.get(key)
+    if diff is not None:
+        contract_diff_cache_hits.inc()
+    else:
+        diff = await crud.get_contract_diff(db, *key)
+        if diff is not None:
+            contract_diff_db_hits.inc()
+            diff = UnifiedDiff(diff.diff, diff.additions, diff.deletions)
+        else:
+            diff = await _compute_contract_diff(
+                db, address, network, key, base_contract
+            )
+        contract_diff_cache.put(key, diff)
+
+    return ContractDiff(
+        name=name,
+        base_name=base_name,
+        diff=diff.diff,
+        additions=diff.additions,
+        deletions=diff.deletions,
+    )
+
+
+async def _compute_contract_diff(
+    db: AsyncSession,
+    address: str,
+    network_id: Optional[NetworkID],
+    key: Tuple,
+    base_contract: BaseContract,
+) -> UnifiedDiff:
+    source_hash, name, base_name, _ = key
+    code = (await crud.get_code_units_by_hashes(db, [source_hash])).get(source_hash)
+    if code is None:
+        code = await _parse_contract_code(db, address, network_id)
+    if not code or not code.get(name):
+        raise HTTPException(status_code=404, detail="Could not parse contract")
+
+    try:
+        diff = await diff_service.run(
+            make_unified_diff,
+            base_contract.code[base_name],
+            code[name],
+            base_name,
+            name,
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Diff timed out")
+    contract_diffs_computed.inc()
+    await crud.save_contract_diff(db, *key, diff)
+    return diff
+
+
+async def _parse_contract_code(
+    db: AsyncSession, address: str, network_id: Optional[NetworkID]
+) -> Optional[Dict[str, str]]:
+    # Not parsed at ingest yet (e.g. before the backfill has run)
+    contract = await crud.get_contract(db, address=address, network_id=network_id)
+    code = (await diff_service.parse_source_codes([contract.source_code]))[0]
+    if code is not None:
+        await crud.save_contract_code_units(db, {contract.source_hash: code})
+    return code
+
+
 @app.get("/api/{catchall:path}", status_code=404, include_in_schema=False)
 async def invalid_api():
     return None
@@ -151,10 +362,10 @@ async def post_telegram_update(request: Request):
             return
         chat_id = int(message["chat"]["id"])
         text = message["text"]
-        try:
-            handle_commands(chat_id, text)
-        except Exception as e:
-            logging.error(e)
+        # Acknowledge right away, commands are handled by background workers
+        if not command_queue.submit(body.get("update_id"), chat_id, text):
+            # Telegram redelivers the update later
+            raise HTTPException(status_code=503, detail="Command queue is full")
     return
 
 
@@ -176,5 +387,28 @@ def read_index(request: Request):
 
 @app.on_event("startup")
 async def startup_event():
+    base_contract_registry.load()
+    diff_service.start()
+    delivery_queue.start()
+    command_queue.start()
     await set_telegram_webhook_url()
-    asyncio.create_task(scrape_verified_contracts())
+    # Every worker contends, only the advisory lock holder discovers contracts,
+    # but all of them help drain the ingest queue
+    if settings.api_runs_scraper:
+        # Fail at startup rather than in the elected scraper on every retry
+        get_scrape_networks()
+        scraper_election.start()
+        fetch_worker.start()
+        process_worker.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await scraper_election.stop()
+    await fetch_worker.stop()
+    await process_worker.stop()
+    await command_queue.stop()
+    await delivery_queue.stop()
+    await close_session()
+    diff_service.shutdown()
+    await engine.dispose()
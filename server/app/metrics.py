@@ -0,0 +1,71 @@
+from typing import Callable, Dict, Sequence
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self, fn: Callable[[], float]):
+        self._fn = fn
+
+    @property
+    def value(self) -> float:
+        return self._fn()
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        self._count += 1
+        self._sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self._counts[i] += 1
+                return
+        self._counts[-1] += 1
+
+    @property
+    def value(self) -> Dict[str, object]:
+        # Cumulative bucket counts, like Prometheus
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self._counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": self._count, "sum": self._sum, "buckets": buckets}
+
+
+_metrics: Dict[str, object] = {}
+
+
+def counter(name: str) -> Counter:
+    if name not in _metrics:
+        _metrics[name] = Counter()
+    return _metrics[name]
+
+
+def gauge(name: str, fn: Callable[[], float]) -> Gauge:
+    _metrics[name] = Gauge(fn)
+    return _metrics[name]
+
+
+def histogram(name: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    if name not in _metrics:
+        _metrics[name] = Histogram(buckets)
+    return _metrics[name]
+
+
+def snapshot() -> Dict[str, object]:
+    return {name: metric.value for name, metric in sorted(_metrics.items())}
@@ -1,10 +1,29 @@
-from sqlalchemy import Column, Computed, Date, Enum, Index, String
-from sqlalchemy.dialects.postgresql import ARRAY, BIGINT, TEXT, TIMESTAMP, TSVECTOR
+import hashlib
+
+from sqlalchemy import (
+    Column,
+    Date,
+    Enum,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+)
+from sqlalchemy.dialects.postgresql import (
+    ARRAY,
+    BIGINT,
+    JSONB,
+    TEXT,
+    TIMESTAMP,
+    TSVECTOR,
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from sqlalchemy.types import TypeDecorator
 
-from app.enums import NetworkID
+from app.enums import IngestStage, JobStatus, NetworkID
 
 Base = declarative_base()
 
@@ -14,6 +33,35 @@ class TSVector(TypeDecorator):
     cache_ok = True
 
 
+class ContractSource(Base):
+    """ABI and source shared by every contract with byte-identical code.
+
+    Keyed by a hash of the content, so forks of the same source are stored,
+    indexed and parsed once.
+    """
+
+    __tablename__ = "contract_sources"
+
+    hash = Column(String, primary_key=True)
+    abi = Column(TEXT, nullable=False)
+    source_code = Column(TEXT, nullable=False)
+
+    # Weighted name, ABI and source identifiers (see app.search), set at ingest.
+    # Only used in WHERE and ORDER BY clauses, so never loaded onto instances.
+    search_vector = deferred(Column(TSVector()))
+
+    __table_args__ = (
+        Index(
+            "ix_contract_sources_search_vector", search_vector, postgresql_using="gin"
+        ),
+    )
+
+    @staticmethod
+    def hash_of(abi: str, source_code: str) -> str:
+        content = f"{abi}\x1f{source_code}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
 class Contract(Base):
     __tablename__ = "contracts"
 
@@ -21,27 +69,130 @@ class Contract(Base):
     name = Column(String, nullable=False)
     compiler = Column(String, nullable=False)
     version = Column(String, nullable=False)
-    verified_date = Column(Date, nullable=False)
-    abi = Column(TEXT, nullable=False)
-    source_code = Column(TEXT, nullable=False)
-    network_id = Column(Enum(NetworkID), nullable=False)
+    # Unknown for contracts imported by address
+    verified_date = Column(Date)
+    source_hash = Column(
+        String, ForeignKey("contract_sources.hash"), nullable=False, index=True
+    )
+    # The same address can hold different contracts on different networks
+    network_id = Column(Enum(NetworkID), primary_key=True)
     timestamp = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
     )
     license = Column(String)
+    # Closest base contract and its line diff count, as of the base contract
+    # corpus version they were computed against
+    closest_base_contract = Column(String)
+    closest_base_diffs = Column(Integer)
+    base_corpus_version = Column(String)
 
-    __ts_vector__ = Column(
-        TSVector(),
-        Computed("to_tsvector('simple', abi || source_code)", persisted=True),
-    )
+    # Loaded explicitly with joinedload, since async sessions can't lazy load
+    source = relationship(ContractSource, lazy="raise")
 
     __table_args__ = (
-        Index("ix_contracts___ts_vector__", __ts_vector__, postgresql_using="gin"),
+        Index("ix_contracts_timestamp_address", timestamp, address),
+        Index(
+            "ix_contracts_network_id_timestamp_address", network_id, timestamp, address
+        ),
+        Index(
+            "ix_contracts_closest_base_contract",
+            closest_base_contract,
+            closest_base_diffs,
+        ),
     )
 
+    @property
+    def abi(self) -> str:
+        return self.source.abi
+
+    @property
+    def source_code(self) -> str:
+        return self.source.source_code
+
     @staticmethod
     def search(query: str):
-        return Contract.__ts_vector__.op("@@")(func.plainto_tsquery("simple", query))
+        return Contract.source.has(
+            ContractSource.search_vector.op("@@")(func.plainto_tsquery("simple", query))
+        )
+
+    @staticmethod
+    def search_rank(query: str):
+        # Needs contract_sources joined in
+        return func.ts_rank(
+            ContractSource.search_vector, func.plainto_tsquery("simple", query)
+        )
+
+
+class ContractCodeUnits(Base):
+    __tablename__ = "contract_code_units"
+
+    source_hash = Column(
+        String,
+        ForeignKey("contract_sources.hash", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # Parsed {unit_name: code} of the source
+    code = Column(JSONB, nullable=False)
+
+
+class ContractDiff(Base):
+    """Unified diff of a source's contract against a version of a base contract"""
+
+    __tablename__ = "contract_diffs"
+
+    source_hash = Column(
+        String,
+        ForeignKey("contract_sources.hash", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    name = Column(String, primary_key=True)
+    base_name = Column(String, primary_key=True)
+    base_hash = Column(String, primary_key=True)
+    diff = Column(TEXT, nullable=False)
+    additions = Column(Integer, nullable=False)
+    deletions = Column(Integer, nullable=False)
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class IngestJob(Base):
+    """A unit of scraping work handed between stages.
+
+    Workers claim pending jobs with SKIP LOCKED and lease them while running,
+    so a job held by a crashed worker is picked up again once its lease expires.
+    """
+
+    __tablename__ = "ingest_jobs"
+
+    job_id = Column(BIGINT, primary_key=True)
+    stage = Column(Enum(IngestStage), nullable=False)
+    address = Column(String, nullable=False)
+    # Addresses are only unique within a network
+    network_id = Column(Enum(NetworkID), nullable=False)
+    # Contract metadata scraped at discovery
+    payload = Column(JSONB, nullable=False)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(TEXT)
+    run_after = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+    locked_at = Column(TIMESTAMP(timezone=True))
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_ingest_jobs_stage_network_id_address",
+            stage,
+            network_id,
+            address,
+            unique=True,
+        ),
+        Index("ix_ingest_jobs_stage_status_run_after", stage, status, run_after),
+    )
 
 
 class ContractAlert(Base):
@@ -54,3 +205,46 @@ class ContractAlert(Base):
     __table_args__ = (
         Index("ix_contract_alerts__chat_ids", chat_ids, postgresql_using="gin"),
     )
+
+
+class ScrapeWatermark(Base):
+    __tablename__ = "scrape_watermarks"
+
+    network_id = Column(Enum(NetworkID), primary_key=True)
+    last_address = Column(String, nullable=False)
+    last_verified_date = Column(Date, nullable=False)
+    last_full_scrape = Column(TIMESTAMP(timezone=True))
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+
+class BackfillCheckpoint(Base):
+    """How far a historical backfill got, so it can resume after a restart"""
+
+    __tablename__ = "backfill_checkpoints"
+
+    # "pages", or the hash of an imported address list
+    name = Column(String, primary_key=True)
+    # Next page number, or next index into the address list
+    position = Column(Integer, nullable=False)
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+
+class RateLimitBucket(Base):
+    """Token bucket state of a rate budget shared by every process"""
+
+    __tablename__ = "rate_limit_buckets"
+
+    name = Column(String, primary_key=True)
+    # Negative while callers are waiting off reserved tokens
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False)
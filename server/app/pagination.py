@@ -0,0 +1,33 @@
+import base64
+import datetime
+from typing import NamedTuple, Optional
+
+
+class Cursor(NamedTuple):
+    """Position after the last row of a page, in (timestamp, address) order"""
+
+    timestamp: datetime.datetime
+    address: str
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    raw = f"{cursor.timestamp.isoformat()}|{cursor.address}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    """Raises ValueError for cursors not produced by encode_cursor"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, address = raw.split("|", 1)
+        return Cursor(datetime.datetime.fromisoformat(timestamp), address)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+
+
+def next_cursor(rows: list, limit: int) -> Optional[Cursor]:
+    # A short page means there is nothing after it
+    if len(rows) == 0 or len(rows) < limit:
+        return None
+    return Cursor(rows[-1].timestamp, rows[-1].address)
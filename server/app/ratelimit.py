@@ -0,0 +1,86 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+from sqlalchemy import extract, func, literal
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import engine
+from app.models import RateLimitBucket
+
+
+class TokenBucket:
+    """Async token bucket shared by every caller of a rate-limited API.
+
+    Callers reserve a token up front and sleep off any debt, so concurrent
+    acquires are ordered without a lock (the event loop is single threaded).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        self._refill(time.monotonic())
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def penalize(self, seconds: float):
+        """Drain the bucket so every caller backs off after an upstream throttle"""
+        self._refill(time.monotonic())
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class SharedTokenBucket:
+    """Token bucket kept in Postgres, so processes on every node draw on one
+    budget rather than each spending the full rate.
+
+    Works like TokenBucket, with one round trip per acquire: the reservation is
+    a single upsert that refills, takes a token and returns the balance.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: Optional[float] = None):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+
+    async def acquire(self):
+        tokens = await self._update(lambda refilled: refilled - 1)
+        if tokens < 0:
+            await asyncio.sleep(-tokens / self.rate)
+
+    async def penalize(self, seconds: float):
+        """Drain the bucket so every caller backs off after an upstream throttle"""
+        await self._update(
+            lambda refilled: func.least(refilled, literal(-seconds * self.rate))
+        )
+
+    async def _update(self, take) -> float:
+        table = RateLimitBucket.__table__
+        elapsed = extract("epoch", func.now() - table.c.updated_at)
+        refilled = func.least(
+            literal(self.capacity), table.c.tokens + elapsed * self.rate
+        )
+        stmt = insert(table).values(
+            name=self.name, tokens=take(literal(self.capacity)), updated_at=func.now()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_=dict(tokens=take(refilled), updated_at=func.now()),
+        ).returning(table.c.tokens)
+        async with engine.begin() as conn:
+            return (await conn.execute(stmt)).scalar()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # Capped exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
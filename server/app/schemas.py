@@ -11,9 +11,12 @@ class VerifiedContractNoData(BaseModel):
     name: str
     compiler: str
     version: str
-    verified_date: datetime.date
+    # Unknown for contracts imported by address
+    verified_date: Optional[datetime.date]
     network_id: NetworkID
     license: Optional[str]
+    closest_base_contract: Optional[str]
+    closest_base_diffs: Optional[int]
 
     class Config:
         orm_mode = True
@@ -28,3 +31,11 @@ class ContractCode(BaseModel):
     name: str
     code: Dict[str, str]
     compiler_version: str
+
+
+class ContractDiff(BaseModel):
+    name: str
+    base_name: str
+    diff: str
+    additions: int
+    deletions: int
@@ -0,0 +1,113 @@
+import json
+import re
+from typing import FrozenSet, Iterable, List, NamedTuple
+
+from sqlalchemy import func, literal_column
+
+from app.alerts import tokenize
+from app.diff import flatten_sources
+
+# Postgres rejects tsvectors over 1MB. Each word of the ASCII identifiers takes
+# at most its length plus 9 bytes in the vector (entry, position and padding),
+# so at most 5 bytes per character counting the separator. Deduplicated
+# identifiers stay far below this cap, it only guards against pathological
+# sources.
+MAX_SEARCH_DOCUMENT_CHARS = 192 * 1024
+
+# String literals are matched too, so a "//" inside one isn't taken for a comment
+_comment_or_string_regex = re.compile(
+    r"//[^\n]*|/\*.*?\*/|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'", re.DOTALL
+)
+# Hex literals, like hard-coded addresses, and numbers are kept whole
+_identifier_regex = re.compile(r"0[xX][0-9a-fA-F]+|[A-Za-z_$][A-Za-z0-9_$]*|[0-9]+")
+
+
+class SearchDocument(NamedTuple):
+    """Text indexed for a contract source, one field per tsvector weight"""
+
+    name: str
+    abi_identifiers: str
+    source_identifiers: str
+
+
+def make_search_document(abi: str, source_code: str) -> SearchDocument:
+    """Contract name, ABI function/event/error names and the identifiers used
+    in the source, each deduplicated. Comments, including SPDX headers, are
+    left out."""
+    try:
+        data = json.loads(source_code)[0]
+        name = data.get("ContractName") or ""
+        source = flatten_sources(data.get("SourceCode") or "")
+    except (ValueError, LookupError, TypeError, AttributeError):
+        name, source = "", source_code
+
+    source = _comment_or_string_regex.sub(_strip_comment, source)
+    # The cap is shared by the whole document, the higher weighted fields first
+    name = _truncate(name, MAX_SEARCH_DOCUMENT_CHARS)
+    abi_identifiers = _truncate(
+        _join(_abi_identifiers(abi)), MAX_SEARCH_DOCUMENT_CHARS - len(name)
+    )
+    source_identifiers = _truncate(
+        _join(_identifier_regex.findall(source)),
+        MAX_SEARCH_DOCUMENT_CHARS - len(name) - len(abi_identifiers),
+    )
+    return SearchDocument(name, abi_identifiers, source_identifiers)
+
+
+def search_lexemes(abi: str, source_code: str) -> FrozenSet[str]:
+    """Lexemes of a source's search document, so alert keywords match the same
+    text that search does"""
+    return tokenize(" ".join(make_search_document(abi, source_code)))
+
+
+def search_vector(name, abi_identifiers, source_identifiers):
+    """SQL for the weighted tsvector of a SearchDocument's fields"""
+    return (
+        _weighted(name, "A")
+        .op("||")(_weighted(abi_identifiers, "B"))
+        .op("||")(_weighted(source_identifiers, "C"))
+    )
+
+
+def _weighted(text, weight: str):
+    return func.setweight(
+        func.to_tsvector("simple", text), literal_column(f"'{weight}'")
+    )
+
+
+def _abi_identifiers(abi: str) -> List[str]:
+    try:
+        entries = json.loads(abi)
+        # The explorer returns the ABI as a JSON string, which is stored encoded
+        if isinstance(entries, str):
+            entries = json.loads(entries)
+    except ValueError:
+        return []
+    if not isinstance(entries, list):
+        return []
+    return [
+        entry["name"]
+        for entry in entries
+        if isinstance(entry, dict)
+        and entry.get("type") in ("function", "event", "error")
+        and entry.get("name")
+    ]
+
+
+def _strip_comment(match) -> str:
+    text = match.group(0)
+    return " " if text.startswith("/") else text
+
+
+def _join(identifiers: Iterable[str]) -> str:
+    return " ".join(dict.fromkeys(identifiers))
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    # At the last whole word that fits, or mid-word if even the first one doesn't
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 0:
+        return ""
+    end = text.rfind(" ", 0, max_chars + 1)
+    return text[: end if end != -1 else max_chars]
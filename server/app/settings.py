@@ -7,12 +7,67 @@ class Settings(BaseSettings):
     telegram_webhook_host = os.environ.get("TELEGRAM_WEBHOOK_HOST")
     telegram_bot_token: str = os.environ.get("TELEGRAM_BOT_TOKEN")
     ftmscan_api_key: str = os.environ.get("FTMSCAN_API_KEY")
+    etherscan_api_key: str = os.environ.get("ETHERSCAN_API_KEY")
+    arbiscan_api_key: str = os.environ.get("ARBISCAN_API_KEY")
+    # Comma separated NetworkID names, each scraped by its own task
+    scrape_networks: str = os.environ.get("SCRAPE_NETWORKS", "fantom")
     scrape_sleep_sec: int = os.environ.get("SCRAPE_SLEEP_SEC")
+    full_scrape_interval_sec: int = os.environ.get("FULL_SCRAPE_INTERVAL_SEC", 3600)
+    # Set to false to run the scraper only via `python -m app.cli scrape`
+    api_runs_scraper: bool = os.environ.get("API_RUNS_SCRAPER", True)
+    leader_retry_sec: float = os.environ.get("LEADER_RETRY_SEC", 10)
+
+    ingest_fetch_workers: int = os.environ.get("INGEST_FETCH_WORKERS", 2)
+    ingest_process_workers: int = os.environ.get("INGEST_PROCESS_WORKERS", 1)
+    ingest_batch_size: int = os.environ.get("INGEST_BATCH_SIZE", 20)
+    ingest_poll_sec: float = os.environ.get("INGEST_POLL_SEC", 5)
+    ingest_lease_sec: float = os.environ.get("INGEST_LEASE_SEC", 600)
+    ingest_max_attempts: int = os.environ.get("INGEST_MAX_ATTEMPTS", 5)
+    ingest_retry_base_sec: float = os.environ.get("INGEST_RETRY_BASE_SEC", 60)
+    ingest_retry_max_sec: float = os.environ.get("INGEST_RETRY_MAX_SEC", 3600)
+
+    diff_candidates: int = os.environ.get("DIFF_CANDIDATES", 3)
+    diff_workers: int = os.environ.get("DIFF_WORKERS", 2)
+    diff_timeout_sec: float = os.environ.get("DIFF_TIMEOUT_SEC", 30)
+    base_match_batch_size: int = os.environ.get("BASE_MATCH_BATCH_SIZE", 100)
+    diff_cache_size: int = os.environ.get("DIFF_CACHE_SIZE", 1000)
+
+    alert_index_refresh_sec: int = os.environ.get("ALERT_INDEX_REFRESH_SEC", 300)
+    command_workers: int = os.environ.get("COMMAND_WORKERS", 4)
+    command_queue_size: int = os.environ.get("COMMAND_QUEUE_SIZE", 1000)
+    telegram_delivery_workers: int = os.environ.get("TELEGRAM_DELIVERY_WORKERS", 8)
+    telegram_messages_per_sec: float = os.environ.get("TELEGRAM_MESSAGES_PER_SEC", 30)
+    telegram_chat_messages_per_sec: float = os.environ.get(
+        "TELEGRAM_CHAT_MESSAGES_PER_SEC", 1
+    )
+    telegram_group_messages_per_min: float = os.environ.get(
+        "TELEGRAM_GROUP_MESSAGES_PER_MIN", 20
+    )
+
+    http_max_connections: int = os.environ.get("HTTP_MAX_CONNECTIONS", 20)
+    http_max_connections_per_host: int = os.environ.get(
+        "HTTP_MAX_CONNECTIONS_PER_HOST", 10
+    )
+    http_keepalive_sec: int = os.environ.get("HTTP_KEEPALIVE_SEC", 30)
+    http_timeout_sec: int = os.environ.get("HTTP_TIMEOUT_SEC", 30)
+
+    ftmscan_requests_per_sec: float = os.environ.get("FTMSCAN_REQUESTS_PER_SEC", 5)
+    etherscan_requests_per_sec: float = os.environ.get("ETHERSCAN_REQUESTS_PER_SEC", 5)
+    arbiscan_requests_per_sec: float = os.environ.get("ARBISCAN_REQUESTS_PER_SEC", 5)
+    # Retries and backoff apply to every explorer
+    ftmscan_max_retries: int = os.environ.get("FTMSCAN_MAX_RETRIES", 5)
+    ftmscan_backoff_base_sec: float = os.environ.get("FTMSCAN_BACKOFF_BASE_SEC", 1)
+    ftmscan_backoff_max_sec: float = os.environ.get("FTMSCAN_BACKOFF_MAX_SEC", 30)
 
     postgres_db: str = os.environ.get("POSTGRES_DB")
     postgres_user: str = os.environ.get("POSTGRES_USER")
     postgres_pw: str = os.environ.get("POSTGRES_PASSWORD")
     postgres_port: int = os.environ.get("POSTGRES_PORT")
+    db_pool_size: int = os.environ.get("DB_POOL_SIZE", 10)
+    db_max_overflow: int = os.environ.get("DB_MAX_OVERFLOW", 20)
+    db_pool_timeout_sec: int = os.environ.get("DB_POOL_TIMEOUT_SEC", 30)
+    db_pool_recycle_sec: int = os.environ.get("DB_POOL_RECYCLE_SEC", 1800)
+    db_statement_timeout_ms: int = os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000)
 
 
 settings = Settings()
@@ -0,0 +1,74 @@
+import difflib
+import hashlib
+import heapq
+import re
+from typing import List, Sequence, Tuple
+
+# Bottom-k MinHash: keep the k smallest shingle hashes of a document
+SKETCH_SIZE = 128
+SHINGLE_SIZE = 5
+
+Fingerprint = Tuple[int, ...]
+
+_token_regex = re.compile(r"\w+|[^\w\s]")
+
+
+def normalize_lines(code: str) -> List[str]:
+    # Collapse whitespace and drop blank lines so formatting changes aren't diffs
+    lines = []
+    for line in code.splitlines():
+        line = " ".join(line.split())
+        if line:
+            lines.append(line)
+    return lines
+
+
+def fingerprint(code: str) -> Fingerprint:
+    tokens = _token_regex.findall(code)
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = {" ".join(tokens)}
+    else:
+        shingles = {
+            " ".join(tokens[i : i + SHINGLE_SIZE])
+            for i in range(len(tokens) - SHINGLE_SIZE + 1)
+        }
+    hashes = (_hash(shingle) for shingle in shingles)
+    return tuple(heapq.nsmallest(SKETCH_SIZE, hashes))
+
+
+def estimate_similarity(a: Fingerprint, b: Fingerprint) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two fingerprints"""
+    if len(a) == 0 or len(b) == 0:
+        return 0.0
+    union_sketch = heapq.nsmallest(SKETCH_SIZE, set(a) | set(b))
+    a_set, b_set = set(a), set(b)
+    shared = sum(1 for h in union_sketch if h in a_set and h in b_set)
+    return shared / len(union_sketch)
+
+
+def top_candidates(
+    target: Fingerprint, candidates: Sequence[Fingerprint], k: int
+) -> List[int]:
+    """Indices of the k candidates most similar to target, in their original order"""
+    scores = [estimate_similarity(target, c) for c in candidates]
+    ranked = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    return sorted(ranked[:k])
+
+
+def count_line_diffs(a: str, b: str) -> int:
+    """Number of normalized lines added or removed to turn a into b"""
+    matcher = difflib.SequenceMatcher(
+        None, normalize_lines(a), normalize_lines(b), autojunk=False
+    )
+    num_diffs = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ("replace", "delete"):
+            num_diffs += i2 - i1
+        if tag in ("replace", "insert"):
+            num_diffs += j2 - j1
+    return num_diffs
+
+
+def _hash(shingle: str) -> int:
+    digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
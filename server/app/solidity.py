@@ -0,0 +1,52 @@
+import re
+from typing import Dict, Tuple
+
+# (kind, start, end) of a top level contract, library or interface
+UnitSpan = Tuple[str, int, int]
+
+# Comments and strings are matched whole so braces and keywords inside them are
+# skipped. Line comments also end at a literal "\n" for sources that were stored
+# with escaped newlines.
+_token_regex = re.compile(
+    r"""
+    (?P<comment>//(?:[^\n\\]|\\(?!n))*|/\*.*?(?:\*/|\Z))
+    |(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    |(?P<unit>\b(?P<kind>contract|library|interface)\s+(?P<name>[A-Za-z_$][\w$]*))
+    |(?P<open>\{)
+    |(?P<close>\})
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def find_units(source: str) -> Dict[str, UnitSpan]:
+    """Spans of every top level unit in a single pass over the source.
+
+    Only the first definition of a name is kept. A unit that is never closed
+    extends to the end of the source.
+    """
+    spans: Dict[str, UnitSpan] = {}
+    depth = 0
+    pending = None  # Unit declared but its body hasn't opened yet
+    current = None  # Unit whose body is open
+
+    for match in _token_regex.finditer(source):
+        group = match.lastgroup
+        if group == "unit":
+            if depth == 0 and current is None:
+                pending = (match.group("kind"), match.group("name"), match.start())
+        elif group == "open":
+            if depth == 0 and pending is not None:
+                current, pending = pending, None
+            depth += 1
+        elif group == "close":
+            depth = max(depth - 1, 0)
+            if depth == 0 and current is not None:
+                kind, name, start = current
+                spans.setdefault(name, (kind, start, match.end()))
+                current = None
+
+    if current is not None:
+        kind, name, start = current
+        spans.setdefault(name, (kind, start, len(source)))
+    return spans
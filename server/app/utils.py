@@ -1,84 +1,291 @@
 import asyncio
+import hashlib
 import json
 import logging
-from datetime import datetime
-from typing import List, Literal
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
 
-from bs4 import BeautifulSoup
-from sqlalchemy.orm import Session
+import aiohttp
+import lxml.html
 
 import app.crud as crud
+from app.alerts import alert_matcher
+from app.base_matches import refresh_stale_base_matches
 from app.bot import send_message
-from app.database import get_db
-from app.diff import get_closest_base_contract
-from app.enums import NetworkID
-from app.models import Contract, ContractAlert
+from app.database import SessionLocal
+from app.diff import get_diffable_base_contracts
+from app.diff_service import diff_service
+from app.enums import IngestStage, NetworkID
+from app.explorers import Explorer, explorers, get_scrape_networks
+from app.leader import SCRAPER_LOCK_ID, LeaderElection
+from app.metrics import counter, gauge
+from app.models import Contract, ScrapeWatermark
+from app.ratelimit import backoff_delay
 from app.schemas import VerifiedContract
+from app.search import search_lexemes
 from app.settings import settings
-from app.web import get_async
+from app.web import get_json_async, get_text_async
 
-FTMSCAN_CONTRACT_API_URL = "https://api.ftmscan.com/api?module=contract&action={action}&address={address}&apikey={api_key}"
-VERIFIED_CONTRACTS_URL = "https://ftmscan.com/contractsVerified/{page}"
 VERIFIED_CONTRACTS_MAX_PAGE = 20
 
 DIFF_BASE_URL = "https://rocketpooldata.com/diff"
 
+scrape_pages_unchanged = counter("scrape_pages_unchanged")
 
-async def scrape_verified_contracts():
-    """Scrape new verified contracts on FTMScan"""
+# Keyed by network and page number, with whether every row on the page was
+# examined. The incremental walk stops at the first known contract, so it
+# leaves the rest of that page to the full reconciliation.
+PageFingerprints = Dict[Tuple[NetworkID, int], Tuple[str, bool]]
+
+# Fingerprint of each network's verified contracts pages as of the last scrape
+# that queued their contracts
+_page_fingerprints: PageFingerprints = {}
+
+
+async def scrape_all_networks():
+    """Scrape every configured network concurrently.
+
+    Each network has its own loop, watermark and rate budget, so one that is
+    slow or throttled doesn't hold up the others.
+    """
+    await asyncio.gather(
+        _refresh_base_matches(),
+        *[scrape_verified_contracts(n) for n in get_scrape_networks()],
+    )
+
+
+async def scrape_verified_contracts(network_id: NetworkID):
+    """Discover new verified contracts on a network's explorer and queue them
+    for ingest"""
     while True:
-        contracts_added = 0
+        contracts_queued = 0
         contracts_skipped = 0
-        new_addresses = []
         try:
-            db = next(get_db())
-            # Iterate backwards so we store the most recent contracts with the latest timestamp
-            for page in range(VERIFIED_CONTRACTS_MAX_PAGE, 0, -1):
-                contracts = await _scrape_page(page)
-                for contract in contracts:
-                    if crud.get_contract(db, contract.address) is None:
-                        abi = await _fetch_contract_data(contract.address, "getabi")
-                        source_code = await _fetch_contract_data(
-                            contract.address, "getsourcecode"
-                        )
-                        contract.abi = abi
-                        contract.source_code = source_code
-
-                        db_contract = crud.create_contract(db, contract)
-                        contracts_added += 1
-                        new_addresses.append(db_contract.address)
-                    else:
-                        contracts_skipped += 1
+            # Sessions are kept short so no connection sits idle in a transaction
+            # while pages are being fetched
+            async with SessionLocal() as db:
+                watermark = await crud.get_scrape_watermark(db, network_id)
+            full_scrape = _is_full_scrape_due(watermark)
+            discover = (
+                _discover_all_pages(network_id)
+                if full_scrape
+                else _discover_new_pages(network_id, watermark)
+            )
+            contracts, contracts_skipped, latest, fingerprints = await discover
+
+            # Fetch workers pick these up, so the watermark can advance as soon
+            # as they are durably queued
+            async with SessionLocal() as db:
+                contracts_queued = await crud.enqueue_ingest_jobs(
+                    db,
+                    IngestStage.fetch,
+                    network_id,
+                    {
+                        c.address: json.loads(c.json(exclude={"abi", "source_code"}))
+                        for c in contracts
+                    },
+                )
+                contracts_skipped += len(contracts) - contracts_queued
+                if latest:
+                    await crud.set_scrape_watermark(
+                        db,
+                        network_id,
+                        latest.address,
+                        latest.verified_date,
+                        full_scrape=full_scrape,
+                    )
+                elif full_scrape and watermark is not None:
+                    # Page 1 was unchanged, so keep the stored latest contract
+                    # but record the sweep, or the next one is due right away
+                    await crud.set_scrape_watermark(
+                        db,
+                        network_id,
+                        watermark.last_address,
+                        watermark.last_verified_date,
+                        full_scrape=True,
+                    )
+            # Only once the contracts are queued, or a failed pass would be
+            # skipped for good
+            _page_fingerprints.update(fingerprints)
         except Exception as e:
-            logging.error(e)
+            logging.error(f"Scraping {network_id.name} failed: {e}")
 
-        logging.info(f"Added {contracts_added}, skipped {contracts_skipped} contracts")
-        if contracts_added > 0:
-            await send_telegram_alerts(new_addresses)
+        logging.info(
+            f"Queued {contracts_queued}, skipped {contracts_skipped} "
+            f"{network_id.name} contracts"
+        )
         await asyncio.sleep(settings.scrape_sleep_sec)
 
 
-async def send_telegram_alerts(new_addresses: List[str]):
-    db: Session = next(get_db())
-    chat_id_to_alerts = {}
-    new_contracts = crud.get_contracts_by_addresses(db, new_addresses)
-    for alert in db.query(ContractAlert).filter(ContractAlert.chat_ids != "{}"):
+async def _refresh_base_matches():
+    while True:
         try:
-            keyword = alert.keyword
-            matches = new_contracts.filter(Contract.search(keyword)).all()
-            if len(matches) == 0:
-                continue
+            await refresh_stale_base_matches(settings.base_match_batch_size)
+        except Exception as e:
+            logging.error(e)
+        await asyncio.sleep(settings.scrape_sleep_sec)
+
+
+def _is_full_scrape_due(watermark: Optional[ScrapeWatermark]) -> bool:
+    if watermark is None or watermark.last_full_scrape is None:
+        return True
+    elapsed = datetime.now(timezone.utc) - watermark.last_full_scrape
+    return elapsed.total_seconds() >= settings.full_scrape_interval_sec
+
+
+async def _discover_new_pages(
+    network_id: NetworkID, watermark: ScrapeWatermark,
+) -> Tuple[List[VerifiedContract], int, Optional[VerifiedContract], PageFingerprints]:
+    """Walk pages newest first and stop at the first contract that is already stored"""
+    contracts: List[VerifiedContract] = []
+    latest = None
+    fingerprints: PageFingerprints = {}
+    for page in range(1, VERIFIED_CONTRACTS_MAX_PAGE + 1):
+        page_html = await fetch_page(page, network_id)
+        fingerprint = page_fingerprint(page_html)
+        known = _page_fingerprints.get((network_id, page))
+        if known is not None and known[0] == fingerprint:
+            # Nothing was verified since the last pass
+            scrape_pages_unchanged.inc()
+            break
+
+        page_contracts = parse_page(page_html, network_id)
+        if latest is None and len(page_contracts) > 0:
+            latest = page_contracts[0]
+
+        existing = await _get_existing_addresses(
+            [c.address for c in page_contracts], network_id
+        )
+        reached_known = False
+        for contract in page_contracts:
+            if (
+                contract.address in existing
+                or contract.address == watermark.last_address
+                or contract.verified_date < watermark.last_verified_date
+            ):
+                reached_known = True
+                break
+            contracts.append(contract)
+        fingerprints[(network_id, page)] = (fingerprint, not reached_known)
+        if reached_known:
+            break
+
+    # Oldest first so the most recent contracts get the latest timestamp
+    contracts.reverse()
+    return contracts, 0, latest, fingerprints
+
+
+async def _discover_all_pages(
+    network_id: NetworkID,
+) -> Tuple[List[VerifiedContract], int, Optional[VerifiedContract], PageFingerprints]:
+    """Reconcile against every page, in case the incremental walk missed anything"""
+    # Iterate backwards so we store the most recent contracts with the latest timestamp
+    pages = list(range(VERIFIED_CONTRACTS_MAX_PAGE, 0, -1))
+    page_results = await asyncio.gather(
+        *[fetch_page(page, network_id) for page in pages], return_exceptions=True
+    )
+
+    contracts: List[VerifiedContract] = []
+    contracts_skipped = 0
+    latest = None
+    fingerprints: PageFingerprints = {}
+    seen_addresses = set()
+    for page, result in zip(pages, page_results):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to scrape page {page}: {result}")
+            continue
+        fingerprint = page_fingerprint(result)
+        if _page_fingerprints.get((network_id, page)) == (fingerprint, True):
+            # Every contract on it was queued or stored in an earlier pass
+            scrape_pages_unchanged.inc()
+            continue
+        fingerprints[(network_id, page)] = (fingerprint, True)
+
+        page_contracts = parse_page(result, network_id)
+        if page == 1 and len(page_contracts) > 0:
+            latest = page_contracts[0]
+        # Rows can shift between pages while they are being fetched
+        page_contracts = [
+            c for c in reversed(page_contracts) if c.address not in seen_addresses
+        ]
+        seen_addresses.update(c.address for c in page_contracts)
+        existing = await _get_existing_addresses(
+            [c.address for c in page_contracts], network_id
+        )
+        contracts.extend(c for c in page_contracts if c.address not in existing)
+        contracts_skipped += len(existing)
+
+    return contracts, contracts_skipped, latest, fingerprints
+
+
+async def _get_existing_addresses(
+    addresses: List[str], network_id: NetworkID
+) -> Set[str]:
+    async with SessionLocal() as db:
+        return await crud.get_existing_addresses(db, addresses, network_id)
 
-            match_base_contracts = get_closest_base_contract(matches)
+
+async def send_telegram_alerts(
+    new_keys: List[Tuple[NetworkID, str]]
+) -> Dict[Tuple[NetworkID, str], str]:
+    """Alert the chats whose keywords match the new contracts, given by
+    (network_id, address).
+
+    Returns the error of each contract whose source failed to tokenize, those
+    are left out of the alerts.
+    """
+    async with SessionLocal() as db:
+        if alert_matcher.is_stale():
+            alert_matcher.load(await crud.get_active_contract_alerts(db))
+        new_contracts = await crud.get_contracts_by_keys(db, new_keys)
+
+    # Tokenize each distinct source once and percolate it through the alert index
+    hash_to_contract = {c.source_hash: c for c in new_contracts}
+    source_lexemes = await asyncio.gather(
+        *[
+            diff_service.run(search_lexemes, c.abi, c.source_code)
+            for c in hash_to_contract.values()
+        ],
+        return_exceptions=True,
+    )
+    hash_to_lexemes = dict(zip(hash_to_contract, source_lexemes))
+    errors = {
+        (c.network_id, c.address): str(hash_to_lexemes[c.source_hash])
+        for c in new_contracts
+        if isinstance(hash_to_lexemes[c.source_hash], Exception)
+    }
+    keyword_to_matches: Dict[str, List[Contract]] = {}
+    for contract in new_contracts:
+        if (contract.network_id, contract.address) in errors:
+            continue
+        for keyword in alert_matcher.match(hash_to_lexemes[contract.source_hash]):
+            keyword_to_matches.setdefault(keyword, []).append(contract)
+    if len(keyword_to_matches) == 0:
+        return errors
+
+    # Closest base contracts were stored at ingest
+    default_base_name = get_diffable_base_contracts()[0].name
+    key_to_base_contract = {
+        (m.network_id, m.address): m.closest_base_contract or default_base_name
+        for matches in keyword_to_matches.values()
+        for m in matches
+    }
+
+    chat_id_to_alerts = {}
+    for keyword, matches in keyword_to_matches.items():
+        try:
             diff_links = [
-                _format_diff_link(m, base_contract)
-                for m, base_contract in zip(matches, match_base_contracts)
+                _format_diff_link(m, key_to_base_contract[(m.network_id, m.address)])
+                for m in matches
             ]
             match_links = [_format_contract_link(m) for m in matches]
             logging.info(f"Matches for '{keyword}': {match_links}")
-            logging.info(f"Closest base contracts: {match_base_contracts}")
+            logging.info(
+                "Closest base contracts: "
+                f"{[key_to_base_contract[(m.network_id, m.address)] for m in matches]}"
+            )
 
-            for chat_id in alert.chat_ids:
+            for chat_id in alert_matcher.get_chat_ids(keyword):
                 existing_alerts = chat_id_to_alerts.get(chat_id, [])
                 existing_alerts.append((keyword, match_links, diff_links))
                 chat_id_to_alerts[chat_id] = existing_alerts
@@ -87,7 +294,7 @@ async def send_telegram_alerts(new_addresses: List[str]):
 
     chat_ids = list(chat_id_to_alerts.keys())
     if len(chat_ids) == 0:
-        return
+        return errors
 
     logging.info(f"Sending alerts to {chat_ids}")
     for chat_id in chat_ids:
@@ -101,34 +308,78 @@ async def send_telegram_alerts(new_addresses: List[str]):
             send_message(chat_id, message)
         except Exception as e:
             logging.error(e)
+    return errors
+
+
+async def fetch_contract_source(address: str, network_id: NetworkID) -> Tuple[str, str]:
+    # getsourcecode also returns the ABI, so one call covers both columns
+    data = await _fetch_contract_data(explorers[network_id], address, "getsourcecode")
+    abi = json.dumps(data[0]["ABI"])
+    return abi, json.dumps(data)
 
 
 async def _fetch_contract_data(
-    address: str, action: Literal["getabi", "getsourcecode"]
-) -> str:
-    # Retry in case of rate limit
-    while True:
-        ftmscan_url = FTMSCAN_CONTRACT_API_URL.format(
-            action=action,
-            address=address,
-            api_key=settings.ftmscan_api_key,
-        )
-        res = await get_async(ftmscan_url)
-        data = res.json()["result"]
-        data_str = json.dumps(data)
-        if "rate limit reached" not in data_str.strip().lower():
-            return data_str
-        await asyncio.sleep(1)
+    explorer: Explorer, address: str, action: Literal["getabi", "getsourcecode"]
+) -> Any:
+    url = explorer.contract_api_url(action, address)
+    for attempt in range(settings.ftmscan_max_retries + 1):
+        if attempt > 0:
+            explorer.retried.inc()
+        await explorer.limiter.acquire()
+        explorer.requests.inc()
+        try:
+            res = await get_json_async(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"{explorer.name} request for {address} failed: {e}")
+            await asyncio.sleep(_explorer_backoff(attempt))
+            continue
+
+        if not _is_rate_limited(res):
+            return res["result"]
+
+        # Rate limited: make every caller sharing the budget, this one included,
+        # wait on the limiter before the next request
+        explorer.throttled.inc()
+        await explorer.limiter.penalize(_explorer_backoff(attempt))
 
+    raise Exception(f"Gave up fetching {action} for {address} after retries")
 
-async def _scrape_page(page: int, network_id: NetworkID = NetworkID.fantom):
-    page = await get_async(VERIFIED_CONTRACTS_URL.format(page=page))
-    soup = BeautifulSoup(page.text, features="html.parser")
+
+def _is_rate_limited(res: dict) -> bool:
+    # Only the error envelope, since a verified source may contain the phrase
+    if res.get("status") != "0":
+        return False
+    message = f"{res.get('result')} {res.get('message')}".lower()
+    return "rate limit reached" in message
+
+
+def _explorer_backoff(attempt: int) -> float:
+    return backoff_delay(
+        attempt, settings.ftmscan_backoff_base_sec, settings.ftmscan_backoff_max_sec
+    )
+
+
+async def fetch_page(page: int, network_id: NetworkID) -> str:
+    url = explorers[network_id].verified_contracts_url(page)
+    return await get_text_async(url)
+
+
+async def scrape_page(page: int, network_id: NetworkID) -> List[VerifiedContract]:
+    return parse_page(await fetch_page(page, network_id), network_id)
+
+
+def page_fingerprint(page_html: str) -> str:
+    # Only the table rows, the rest of the page changes on every request
+    return hashlib.sha256(_table_html(page_html).encode()).hexdigest()
+
+
+def parse_page(page_html: str, network_id: NetworkID) -> List[VerifiedContract]:
+    # Parse just the table with lxml, rather than the whole page
+    table = lxml.html.fragment_fromstring(_table_html(page_html), create_parent="table")
 
     # Find index of data in table based on header
-    header = soup.find("thead").find("tr")
-    header_cells = header.find_all("th")
-    header_names = [cell.text.strip() for cell in header_cells]
+    header_cells = table.xpath("thead/tr[1]/th")
+    header_names = [cell.text_content().strip() for cell in header_cells]
     names_to_save = [
         "Address",
         "Contract Name",
@@ -141,12 +392,13 @@ async def _scrape_page(page: int, network_id: NetworkID = NetworkID.fantom):
 
     # Parse results from table rows
     results: List[VerifiedContract] = []
-    body = soup.find("tbody")
-    rows = body.find_all("tr")
-    for row in rows:
-        cells = row.find_all("td")
-        row_values = [cell.text.strip() for cell in cells]
-        addr, name, compiler, version, dt, license = [row_values[i] for i in data_idx]
+    for row in table.xpath("tbody/tr"):
+        cells = row.xpath("td")
+        # Past the last page the table holds a single "no entries" cell
+        if len(cells) < len(header_cells):
+            continue
+        row_values = [cells[i].text_content().strip() for i in data_idx]
+        addr, name, compiler, version, dt, license = row_values
         verified_dt = datetime.strptime(dt, "%m/%d/%Y")
         results.append(
             VerifiedContract(
@@ -163,12 +415,29 @@ async def _scrape_page(page: int, network_id: NetworkID = NetworkID.fantom):
     return results
 
 
+def _table_html(page_html: str) -> str:
+    start = page_html.find("<thead")
+    end = page_html.find("</tbody>", start)
+    if start == -1 or end == -1:
+        raise ValueError("Verified contracts table not found")
+    return page_html[start : end + len("</tbody>")]
+
+
 def _format_contract_link(contract: Contract):
-    url = f"https://ftmscan.com/address/{contract.address}"
+    url = explorers[contract.network_id].address_url(contract.address)
     short_addr = contract.address[0:6] + "..." + contract.address[-4:]
     return f"[{contract.name} ({short_addr})]({url})"
 
 
 def _format_diff_link(contract: Contract, base_contract_name: str):
-    url = f"{DIFF_BASE_URL}?diff_name={base_contract_name}&addr={contract.address}"
+    url = (
+        f"{DIFF_BASE_URL}?diff_name={base_contract_name}&addr={contract.address}"
+        f"&network_id={contract.network_id.value}"
+    )
     return f"[closest diff with {base_contract_name}]({url})"
+
+
+scraper_election = LeaderElection(
+    "scraper", SCRAPER_LOCK_ID, scrape_all_networks, settings.leader_retry_sec
+)
+gauge("scraper_leader", lambda: int(scraper_election.is_leader))
@@ -1,12 +1,49 @@
 import asyncio
+from typing import Any, Optional
+
+import aiohttp
 import requests
 
+from app.settings import settings
+
 MAX_FETCH_LIMIT = 500
+MAX_STREAM_LIMIT = 100000
 
+_session: Optional[aiohttp.ClientSession] = None
 
-async def get_async(url):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, requests.get, url)
+
+def get_session() -> aiohttp.ClientSession:
+    """Shared client session so every request reuses pooled keep-alive connections"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.http_max_connections,
+            limit_per_host=settings.http_max_connections_per_host,
+            keepalive_timeout=settings.http_keepalive_sec,
+        )
+        timeout = aiohttp.ClientTimeout(total=settings.http_timeout_sec)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def get_text_async(url: str) -> str:
+    async with get_session().get(url) as res:
+        res.raise_for_status()
+        return await res.text()
+
+
+async def get_json_async(url: str) -> Any:
+    async with get_session().get(url) as res:
+        res.raise_for_status()
+        # Explorer APIs don't always send an application/json content type
+        return await res.json(content_type=None)
 
 
 async def post_async(url, data):
@@ -0,0 +1,112 @@
+"""Memory and latency of a contract listing page with and without contract data.
+
+Run from server/ against the configured database:
+
+    python -m benchmarks.listing [--rows 500] [--source-kb 300] [--abi-kb 60]
+
+Rows are seeded inside a transaction that is rolled back at the end, stamped in
+the future so they fill the first page of the most recent listing.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+import app.crud as crud
+from app.database import SessionLocal
+from app.enums import NetworkID
+from app.models import Contract, ContractSource
+from app.schemas import VerifiedContract, VerifiedContractNoData
+
+NUM_RUNS = 5
+
+
+def make_source(i: int, source_kb: int, abi_kb: int):
+    body = "".join(
+        f"    function f{n}(uint256 a) external returns (uint256) {{ return a + {n}; }}\n"
+        for n in range(source_kb * 1024 // 72)
+    )
+    source_code = json.dumps(
+        [{"ContractName": f"Bench{i}", "SourceCode": f"contract Bench{i} {{\n{body}}}"}]
+    )
+    abi = json.dumps(
+        json.dumps(
+            [
+                {"type": "function", "name": f"f{n}", "inputs": [], "outputs": []}
+                for n in range(abi_kb * 1024 // 64)
+            ]
+        )
+    )
+    return abi, source_code
+
+
+async def seed(db, rows: int, source_kb: int, abi_kb: int):
+    for i in range(rows):
+        abi, source_code = make_source(i, source_kb, abi_kb)
+        source_hash = ContractSource.hash_of(abi, source_code)
+        await db.execute(
+            insert(ContractSource)
+            .values(hash=source_hash, abi=abi, source_code=source_code)
+            .on_conflict_do_nothing(index_elements=[ContractSource.hash])
+        )
+        await db.execute(
+            insert(Contract)
+            .values(
+                address=f"0xbench{i:035x}",
+                name=f"Bench{i}",
+                compiler="Solidity",
+                version="v0.8.4",
+                verified_date=date.today(),
+                source_hash=source_hash,
+                network_id=NetworkID.fantom,
+                timestamp=func.now() + timedelta(days=1, microseconds=i),
+            )
+            .on_conflict_do_nothing(
+                index_elements=[Contract.address, Contract.network_id]
+            )
+        )
+
+
+async def measure(db, rows: int, include_contract_data: bool):
+    schema = VerifiedContract if include_contract_data else VerifiedContractNoData
+    latencies, peaks = [], []
+    for _ in range(NUM_RUNS):
+        db.expunge_all()
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        contracts = await crud.get_contracts(
+            db, limit=rows, include_contract_data=include_contract_data
+        )
+        [schema.from_orm(c) for c in contracts]
+        latencies.append(time.perf_counter() - started_at)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    print(
+        f"include_contract_data={include_contract_data}: "
+        f"median {statistics.median(latencies) * 1000:.0f} ms, "
+        f"peak {max(peaks) / 1024 / 1024:.1f} MB"
+    )
+
+
+async def main(rows: int, source_kb: int, abi_kb: int):
+    async with SessionLocal() as db:
+        await seed(db, rows, source_kb, abi_kb)
+        print(f"{rows} rows, {source_kb} KB source and {abi_kb} KB ABI each")
+        await measure(db, rows, True)
+        await measure(db, rows, False)
+        await db.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--source-kb", type=int, default=300)
+    parser.add_argument("--abi-kb", type=int, default=60)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.source_kb, args.abi_kb))
@@ -0,0 +1,59 @@
+"""Time parsing a verified contracts page, the old BeautifulSoup walk vs the
+lxml table parse, and the page fingerprint.
+
+Run from server/, on the bundled fixture or on pages saved from an explorer:
+
+    python -m benchmarks.scrape_page [page.html ...]
+
+The old parser needs beautifulsoup4, which is no longer a requirement.
+"""
+import argparse
+import timeit
+from pathlib import Path
+
+from app.enums import NetworkID
+from app.utils import page_fingerprint, parse_page
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+NUM_RUNS = 20
+
+
+def old_parse_page(page_html: str) -> list:
+    """Table rows as parsed before the switch to lxml"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page_html, features="html.parser")
+    header_cells = soup.find("thead").find("tr").find_all("th")
+    rows = []
+    for row in soup.find("tbody").find_all("tr"):
+        cells = row.find_all("td")
+        if len(cells) < len(header_cells):
+            continue
+        rows.append([cell.text.strip() for cell in cells])
+    return rows
+
+
+def report(label: str, fn):
+    sec = min(timeit.repeat(fn, number=1, repeat=NUM_RUNS))
+    print(f"  {label}: {sec * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*", type=Path)
+    args = parser.parse_args()
+
+    for path in args.pages or sorted(FIXTURES_PATH.glob("*.html")):
+        page_html = path.read_text()
+        num_rows = len(parse_page(page_html, NetworkID.fantom))
+        print(f"{path.name}: {len(page_html) / 1024:.0f} KB, {num_rows} contracts")
+        try:
+            report("html.parser walk", lambda: old_parse_page(page_html))
+        except ImportError:
+            print("  html.parser walk: skipped, beautifulsoup4 is not installed")
+        report("lxml table parse", lambda: parse_page(page_html, NetworkID.fantom))
+        report("fingerprint", lambda: page_fingerprint(page_html))
+
+
+if __name__ == "__main__":
+    main()
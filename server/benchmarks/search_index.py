@@ -0,0 +1,86 @@
+"""Index size and query latency of the weighted search vector against the
+old full-text vector of abi || source_code.
+
+Run from server/ against the configured database, after the search vectors
+are built:
+
+    python -m benchmarks.search_index [query ...]
+
+The old vector and its GIN index are rebuilt in a temporary table, which can
+take a while on a large contract_sources table.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+DEFAULT_QUERIES = [
+    "MasterChef",
+    "transferOwnership",
+    "rewardPerSecond",
+    "0x21be370d5312f44cb42ce377bc9b8a0cef1a4c83",
+]
+NUM_RUNS = 5
+
+
+async def timed_count(db, table: str, column: str, query: str):
+    stmt = text(
+        f"SELECT count(*) FROM {table} "
+        f"WHERE {column} @@ plainto_tsquery('simple', :query)"
+    )
+    latencies = []
+    for _ in range(NUM_RUNS):
+        started_at = time.perf_counter()
+        count = (await db.execute(stmt, dict(query=query))).scalar()
+        latencies.append(time.perf_counter() - started_at)
+    return count, statistics.median(latencies)
+
+
+async def main(queries):
+    async with SessionLocal() as db:
+        await db.execute(
+            text(
+                "CREATE TEMPORARY TABLE old_search ON COMMIT DROP AS "
+                "SELECT hash, to_tsvector('simple', abi || source_code) AS vector "
+                "FROM contract_sources"
+            )
+        )
+        await db.execute(
+            text("CREATE INDEX old_search_vector ON old_search USING gin (vector)")
+        )
+        await db.execute(text("ANALYZE old_search"))
+
+        sizes = (
+            await db.execute(
+                text(
+                    "SELECT pg_relation_size('old_search_vector'), "
+                    "pg_relation_size('ix_contract_sources_search_vector')"
+                )
+            )
+        ).one()
+        print(
+            f"GIN index size: old {sizes[0] / 1024 / 1024:.1f} MB, "
+            f"new {sizes[1] / 1024 / 1024:.1f} MB"
+        )
+
+        for query in queries:
+            old_count, old_sec = await timed_count(db, "old_search", "vector", query)
+            new_count, new_sec = await timed_count(
+                db, "contract_sources", "search_vector", query
+            )
+            print(
+                f"{query!r}: old {old_sec * 1000:.1f} ms ({old_count} rows), "
+                f"new {new_sec * 1000:.1f} ms ({new_count} rows)"
+            )
+        await db.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    args = parser.parse_args()
+    asyncio.run(main(args.queries))
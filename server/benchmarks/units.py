@@ -0,0 +1,89 @@
+"""Time unit extraction on a large multi-unit source, old vs new.
+
+Run from server/:
+
+    python -m benchmarks.units [--copies 60]
+
+The source is the shipped base contracts repeated with every unit renamed, so
+it has realistic code with hundreds of libraries, interfaces and contracts.
+"""
+import argparse
+import re
+import time
+from pathlib import Path
+
+from app.diff import BASE_CONTRACTS_PATH, contracts_to_code
+from app.solidity import find_units
+
+
+def old_contracts_to_code(source_str: str):
+    """contracts_to_code before the single-pass scanner"""
+    file_regex = r"(library|interface|contract)\s+(\S+)\s*.*\s*\{"
+    matches = re.findall(file_regex, source_str)
+    code = {}
+    for match in matches:
+        filetype, name = match
+        code[name] = _old_get_code_from_file(source_str, filetype, name)
+    return code
+
+
+def _old_get_code_from_file(source_str: str, type: str, name: str):
+    contract_regex = rf"{type}\s+{name}\s*.*\s*\{{"
+    res = re.search(contract_regex, source_str)
+    if not res:
+        return None
+
+    start_idx = res.start()
+    close_idx = res.end() + 1
+    opened_braces = 1
+    while opened_braces > 0 and close_idx < len(source_str):
+        if source_str[close_idx] == "{":
+            opened_braces += 1
+        elif source_str[close_idx] == "}":
+            opened_braces -= 1
+        close_idx += 1
+
+    res = source_str[start_idx : min(close_idx + 1, len(source_str))]
+    return res.strip("\\").replace("\\\\n", "\n").replace('\\\\"', '"')
+
+
+def make_source(copies: int) -> str:
+    base = "\n".join(
+        path.read_text() for path in sorted(Path(BASE_CONTRACTS_PATH).glob("*/*.sol"))
+    )
+    names = sorted(find_units(base), key=len, reverse=True)
+    name_regex = re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b")
+    return "\n".join(
+        name_regex.sub(lambda m: f"{m.group(1)}_{i}", base) for i in range(copies)
+    )
+
+
+def timed(fn, *args):
+    started_at = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=60)
+    args = parser.parse_args()
+
+    source = make_source(args.copies)
+    new, new_sec = timed(contracts_to_code, source)
+    old, old_sec = timed(old_contracts_to_code, source)
+    print(f"{len(source) / 1e6:.1f} MB source, {len(new)} units")
+    print(f"old: {old_sec:.2f}s ({len(old)} units)")
+    print(f"new: {new_sec:.2f}s")
+
+    # The old scan kept the character after the closing brace
+    same = sum(
+        1
+        for name, code in new.items()
+        if old.get(name) is not None and old[name].rstrip().startswith(code)
+    )
+    print(f"{same}/{len(new)} units match the old output up to the closing brace")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import difflib
+import json
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+import app.diff as diff
+from app.diff import (
+    BaseContractRegistry,
+    get_candidate_base_contracts,
+    get_closest_base_contract,
+    get_diffable_base_contracts,
+)
+from app.settings import settings
+from app.similarity import fingerprint
+
+SHIPPED_BASES = ["TombGenesisRewardPool", "Two_ombGenesisRewardPool"]
+# Units of the shipped sources that are distinct enough to act as extra bases
+LIBRARY_BASES = ["Address", "IERC20", "SafeERC20", "SafeMath"]
+
+
+def _old_num_diffs(a: str, b: str) -> int:
+    # The character level count the two stage engine replaced
+    num_diffs = 0
+    for line in difflib.Differ().compare(a, b):
+        if line[:2] in ["+ ", "- "] and line[2:].strip() != "":
+            num_diffs += 1
+    return num_diffs
+
+
+def _old_closest(base_codes: dict, new_code: str) -> str:
+    min_diffs = float("inf")
+    closest = None
+    for name, base_code in base_codes.items():
+        num_diffs = _old_num_diffs(base_code, new_code)
+        if num_diffs < min_diffs:
+            min_diffs = num_diffs
+            closest = name
+    return closest
+
+
+def _mutate(code: str, name: str) -> str:
+    # Drop and add some lines and rename the unit, like a typical fork
+    lines = code.splitlines()
+    mutated = [line for i, line in enumerate(lines) if i % 17 != 5]
+    mutated.insert(len(mutated) // 2, "    uint256 public forkedAt = 1;")
+    return "\n".join(mutated).replace(name, f"Forked{name}")
+
+
+def _as_contract(name: str, code: str):
+    return SimpleNamespace(name=name, source_code=json.dumps([{"SourceCode": code}]))
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    shipped = BaseContractRegistry(diff.BASE_CONTRACTS_PATH)
+    shipped.load()
+    for name in SHIPPED_BASES:
+        shutil.copytree(
+            os.path.join(diff.BASE_CONTRACTS_PATH, name), str(tmp_path / name)
+        )
+    for name in LIBRARY_BASES:
+        os.mkdir(str(tmp_path / name))
+        (tmp_path / name / f"{name}.sol").write_text(
+            shipped.get(SHIPPED_BASES[0]).code[name]
+        )
+
+    registry = BaseContractRegistry(str(tmp_path))
+    registry.load()
+    monkeypatch.setattr(diff, "base_contract_registry", registry)
+    monkeypatch.setattr(settings, "diff_candidates", 2)
+    return registry
+
+
+@pytest.mark.parametrize(
+    "base_name", ["TombGenesisRewardPool", "Two_ombGenesisRewardPool", "SafeMath"]
+)
+def test_matches_old_implementation_with_more_bases_than_candidates(
+    registry, base_name
+):
+    base_contracts = get_diffable_base_contracts()
+    assert len(base_contracts) > settings.diff_candidates
+
+    new_name = f"Forked{base_name}"
+    new_code = _mutate(registry.get(base_name).code[base_name], base_name)
+
+    # The prefilter must actually exclude bases for the parity to mean anything
+    candidates = get_candidate_base_contracts(base_contracts, fingerprint(new_code))
+    assert len(candidates) == settings.diff_candidates
+
+    old_closest = _old_closest(
+        {b.name: b.code[b.name] for b in base_contracts}, new_code
+    )
+    closest = get_closest_base_contract([_as_contract(new_name, new_code)])
+    assert closest == [old_closest] == [base_name]
+
+
+def test_unparseable_contract_gets_first_base(registry):
+    closest = get_closest_base_contract([_as_contract("Missing", "contract Other {}")])
+    assert closest == [get_diffable_base_contracts()[0].name]